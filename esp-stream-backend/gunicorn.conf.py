@@ -0,0 +1,18 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+Command-line flags in the Procfile / render.yaml still decide bind, workers
+and threads; this file only adds the per-process startup that main.py keeps
+out of import time.
+"""
+
+
+def when_ready(server):
+    # Reconcile the recordings catalog once, in the master, before any worker is forked
+    import main
+    main.startup_rescan()
+
+
+def post_worker_init(worker):
+    # Each worker opens its own catalog connection and loads the DVR index
+    import main
+    main.init_app()
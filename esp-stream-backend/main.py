@@ -1,17 +1,32 @@
 import cv2
+import numpy as np
 import time
 import os
+import re
+import bisect
+import sqlite3
+import hashlib
+import shutil
+import subprocess
+import tempfile
 import gc
 import threading
+import asyncio
 import platform
 from flask import Flask, Response, jsonify, request
 from datetime import timezone
+from functools import partial
 from inference import InferencePipeline
 from inference.core.interfaces.camera.entities import VideoFrame
+from inference.core.interfaces.stream.entities import ModelConfig
+from inference.core.interfaces.stream.model_handlers.roboflow_models import default_process_frame
+from inference.models.utils import get_model
 import supervision as sv
 import socket
 from urllib.parse import urlparse
 import traceback
+import queue
+from contextlib import contextmanager
 # --- add at top ---
 import socket, statistics
 from collections import deque
@@ -20,8 +35,10 @@ import uuid
 from collections import deque, defaultdict
 from datetime import datetime, timedelta
 from flask import send_from_directory
+from werkzeug.exceptions import HTTPException
 import requests
 import json
+from video_encoder import EncoderProcessWriter
 
 
 
@@ -64,13 +81,22 @@ def _cors(r):
         # Allow all origins for development (remove in production if needed)
         r.headers["Access-Control-Allow-Origin"] = "*"
     r.headers["Access-Control-Allow-Methods"] = "GET, POST, DELETE, OPTIONS"
-    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Range"
-    r.headers["Access-Control-Expose-Headers"] = "Content-Range, Accept-Ranges, Content-Length"
+    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Range, If-Range, If-None-Match"
+    r.headers["Access-Control-Expose-Headers"] = "Content-Range, Accept-Ranges, Content-Length, ETag, Last-Modified"
     return r
 
 # ========= GLOBALS =========
 lock = threading.Lock()
-last_frame = None
+last_frame = None  # Annotated frame, or None if annotation was skipped (see last_scene)
+last_scene = None  # (raw frame, detections, labels, feed) of the latest published frame
+last_timing = None  # {"captured_at", "published_at"} of the latest published frame
+frame_cond = threading.Condition(lock)  # Shares `lock` so last_frame and frame_seq change together
+frame_seq = 0  # Incremented on every published frame
+annotate_lock = threading.Lock()  # Serializes on-demand annotation so a frame is drawn only once
+FRAME_SUBSCRIBER_QUEUE_SIZE = 60  # frames buffered per subscriber (e.g. the recorder)
+frame_subscribers = []  # queues fed by publish_frame()
+frame_subscribers_lock = threading.Lock()
+annotation_stats = {"annotated": 0, "skipped": 0, "on_demand": 0}
 current_feed = "primary"
 current_camera_url = PRIMARY_URL  # Track current camera URL for failover
 pipeline = None
@@ -92,10 +118,20 @@ seen_alert_hashes = set()  # Track unique alerts to prevent duplicates
 # Make sure last_labels and stable_labels are always defined and accessible
 last_labels = []
 stable_labels = []
-black_frame_count = 0
-blackout_threshold = 5  # seconds
+blackout_threshold = 5  # seconds a dark/uniform frame condition must last before failover
 frame_check_interval = 1  # seconds
-last_blackout_time = None
+
+# Feed signal detector (blackout / uniform / frozen), run on a downscaled luma grid
+BLACKOUT_GRID_SIZE = (64, 36)  # (width, height) of the sampled grid, independent of camera resolution
+BLACKOUT_CHECK_EVERY = 3  # check every Nth frame
+BLACKOUT_BRIGHTNESS_THRESHOLD = 10  # mean luma below this = dark
+UNIFORM_STDDEV_THRESHOLD = 2.0  # luma stddev below this = uniform (solid "no signal" screens)
+FROZEN_DIFF_THRESHOLD = 0.3  # mean abs luma change between checks below this = frozen
+FROZEN_SECONDS = 30  # how long a frozen picture must last before failover (0 disables)
+signal_condition_since = {"blackout": None, "uniform": None, "frozen": None}
+last_signal_grid = None
+signal_stats = {"frames": 0, "checks": 0}
+signal_check_costs = deque(maxlen=500)  # seconds per check
 
 # --- globals ---
 health = {
@@ -111,6 +147,41 @@ health = {
 # rolling frame timestamps (for FPS)
 _frame_times = deque(maxlen=120)
 
+# Passive liveness: the failover watcher reads frame arrival times instead of
+# opening its own capture; it only probes the camera once frames stop
+FRAME_STALL_SECONDS = 3.0  # frame age that counts as a stall
+PIPELINE_STARTUP_GRACE_SECONDS = 30  # allowed time from pipeline start to its first frame
+LIVENESS_CHECK_INTERVAL = 0.5
+LIVENESS_TCP_TIMEOUT = 1.0  # per TCP attempt when probing a stalled feed
+LIVENESS_FRAME_TIMEOUT = 2.0  # frame check when probing a stalled feed
+STALL_FAILOVER_PROBES = 3  # consecutive stalls with a live camera before failing over instead of restarting
+last_frame_arrival = None  # time.time() of the last on_prediction call
+pipeline_started_at = None  # when run_inference started the current pipeline
+pipeline_failed_at = None  # when that pipeline gave up before delivering frames (skip or init error)
+liveness_stats = {"stalls": 0, "probes": 0, "probe_ok": 0, "restarts": 0, "failures": 0,
+                  "last_detection_seconds": None}
+
+# Staged frame path: the inference callback only enqueues, a worker thread does the rest
+FRAME_QUEUE_SIZE = 4
+FRAME_QUEUE_DROP_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block" (backpressure into inference)
+frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+frame_queue_lock = threading.Lock()
+frame_queue_stats = {"enqueued": 0, "processed": 0, "dropped": 0, "max_depth": 0}
+frame_worker_thread = None
+
+# Per-stage frame latency (rolling windows, seconds)
+LATENCY_WINDOW = 500  # samples kept per stage
+LATENCY_STAGES = ("inference", "queue_wait", "annotation", "publish", "first_byte", "end_to_end",
+                  "failure_detection", "failover_first_frame")
+latency_lock = threading.Lock()
+latency_samples = {stage: deque(maxlen=LATENCY_WINDOW) for stage in LATENCY_STAGES}
+first_sent_seq = 0  # Last frame seq whose first byte went out on /ai_feed
+
+# Counters/summaries for /metrics that are not already tracked in a stats dict.
+# Keyed by (metric name, sorted label tuple).
+metrics_lock = threading.Lock()
+metric_values = defaultdict(float)
+
 # Configure annotators - labels will show object names with confidence
 label_annotator = sv.LabelAnnotator()
 box_annotator = sv.BoxAnnotator()
@@ -287,6 +358,12 @@ def parse_host_port_from_url(url):
     return host, port or 80
 
 
+def camera_key(url):
+    """Stable per-camera key without credentials, e.g. '192.168.1.20:8080'"""
+    host, port = parse_host_port_from_url(url)
+    return f"{host}:{port}"
+
+
 def tcp_probe_attempts(url, attempts=2, timeout=2.0, try_alt_port_8080=True):
     """
     Try TCP connection attempts to the host:port in `url`.
@@ -320,6 +397,110 @@ def tcp_probe_attempts(url, attempts=2, timeout=2.0, try_alt_port_8080=True):
     return False, results
 
 
+# ========= METRICS =========
+METRICS_PREFIX = "failovercam_"
+
+# name -> (type, help) for every metric rendered by /metrics
+METRIC_DEFS = {
+    "frames_received_total": ("counter", "Frames delivered by the inference pipeline callback"),
+    "frames_annotated_total": ("counter", "Frames annotated, eagerly or on demand"),
+    "frames_annotation_skipped_total": ("counter", "Frames published without annotation because nobody was watching"),
+    "frames_encoded_total": ("counter", "JPEG encodes for /ai_feed, across all variants"),
+    "frames_dropped_total": ("counter", "Frames dropped by the frame queue drop policy"),
+    "motion_gate_frames_total": ("counter", "Frames seen by the motion gate, by camera and result (inferred/skipped)"),
+    "frame_queue_depth": ("gauge", "Frames waiting for the frame worker"),
+    "inference_fps": ("gauge", "Rolling inference frame rate"),
+    "failovers_total": ("counter", "Camera failovers by cause"),
+    "alerts_created_total": ("counter", "Alerts created by type"),
+    "alerts_deduplicated_total": ("counter", "Alerts suppressed as duplicates"),
+    "logs_suppressed_total": ("counter", "Log entries suppressed as duplicates"),
+    "recording_bytes_written_total": ("counter", "Bytes written to finished recordings"),
+    "preroll_buffer_bytes": ("gauge", "Memory held by the pre-event frame buffer, by camera"),
+    "stream_clients": ("gauge", "Connected /ai_feed clients"),
+    "stream_variants": ("gauge", "Active /ai_feed resolution/quality variants"),
+    "lock_wait_seconds": ("summary", "Time spent waiting to acquire shared locks"),
+}
+
+
+def metric_inc(name, value=1, **labels):
+    """Increment a counter kept in metric_values"""
+    key = (name, tuple(sorted(labels.items())))
+    with metrics_lock:
+        metric_values[key] += value
+
+
+def metric_observe(name, value, **labels):
+    """Add an observation to a summary (tracked as _sum and _count)"""
+    labels_key = tuple(sorted(labels.items()))
+    with metrics_lock:
+        metric_values[(name + "_sum", labels_key)] += value
+        metric_values[(name + "_count", labels_key)] += 1
+
+
+@contextmanager
+def timed_lock(lk, name):
+    """Acquire `lk` and record how long the acquire blocked under lock_wait_seconds{lock=name}"""
+    start = time.perf_counter()
+    lk.acquire()
+    metric_observe("lock_wait_seconds", time.perf_counter() - start, lock=name)
+    try:
+        yield
+    finally:
+        lk.release()
+
+
+def _format_metric(name, labels, value):
+    if labels:
+        label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+        return f"{METRICS_PREFIX}{name}{{{label_str}}} {value:g}"
+    return f"{METRICS_PREFIX}{name} {value:g}"
+
+
+def render_metrics():
+    """Render all metrics in Prometheus text exposition format"""
+    # Values that already live in other stats dicts are read from there
+    with frame_queue_lock:
+        queue_info = dict(frame_queue_stats)
+    with stream_stats_lock:
+        clients = stream_stats["clients"]
+    with stream_variants_lock:
+        variant_count = len(stream_variants)
+    samples = defaultdict(list)
+    samples["frames_received_total"].append(((), queue_info["enqueued"]))
+    samples["frames_annotated_total"].append(((), annotation_stats["annotated"] + annotation_stats["on_demand"]))
+    samples["frames_annotation_skipped_total"].append(((), annotation_stats["skipped"]))
+    samples["frames_dropped_total"].append(((), queue_info["dropped"]))
+    samples["frame_queue_depth"].append(((), frame_queue.qsize()))
+    samples["inference_fps"].append(((), health["fps"] or 0.0))
+    samples["stream_clients"].append(((), clients))
+    samples["stream_variants"].append(((), variant_count))
+    for camera, info in preroll_summary().items():
+        samples["preroll_buffer_bytes"].append(((("camera", camera),), info["bytes"]))
+    with motion_gate_lock:
+        for camera, counts in motion_gate_stats.items():
+            for result, count in counts.items():
+                samples["motion_gate_frames_total"].append(((("camera", camera), ("result", result)), count))
+
+    with metrics_lock:
+        values = list(metric_values.items())
+    for (name, labels), value in values:
+        samples[name].append((labels, value))
+
+    lines = []
+    for name, (metric_type, help_text) in METRIC_DEFS.items():
+        lines.append(f"# HELP {METRICS_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}{name} {metric_type}")
+        if metric_type == "summary":
+            for suffix in ("_sum", "_count"):
+                for labels, value in samples.get(name + suffix, []):
+                    lines.append(_format_metric(name + suffix, labels, value))
+        else:
+            entries = samples.get(name) or [((), 0)]
+            for labels, value in entries:
+                lines.append(_format_metric(name, labels, value))
+    return "\n".join(lines) + "\n"
+
+
 # ========= LOGGING FUNCTION =========
 def add_log(tag, message):
     """Thread-safe logging with duplicate prevention"""
@@ -328,9 +509,10 @@ def add_log(tag, message):
     # Create unique hash for this log (tag + message combination)
     log_hash = f"{tag}:{message}"
     
-    with log_lock:
+    with timed_lock(log_lock, "log"):
         # Skip if this exact log was already added
         if log_hash in seen_log_hashes:
+            metric_inc("logs_suppressed_total")
             return
         
         seen_log_hashes.add(log_hash)
@@ -355,9 +537,10 @@ def add_alert(type, title, description, detected_objects=None, camera=None, conf
     # Create unique hash for this alert (type + title + detected objects)
     alert_hash = f"{type}:{title}:{','.join(detected_objects) if detected_objects else ''}"
     
-    with alerts_lock:
+    with timed_lock(alerts_lock, "alerts"):
         # Skip if this exact alert was already added in the last 5 seconds
         if alert_hash in seen_alert_hashes:
+            metric_inc("alerts_deduplicated_total")
             return
         
         seen_alert_hashes.add(alert_hash)
@@ -379,6 +562,7 @@ def add_alert(type, title, description, detected_objects=None, camera=None, conf
             "speak_message": speak_message  # Voice announcement text
         }
         alerts.append(alert_entry)
+        metric_inc("alerts_created_total", type=type)
         
         # Keep only last 100 alerts
         if len(alerts) > 100:
@@ -395,170 +579,236 @@ def add_alert(type, title, description, detected_objects=None, camera=None, conf
         threading.Thread(target=clear_hash, daemon=True).start()
 
 
+# ========= LATENCY INSTRUMENTATION =========
+def record_latency(stage, seconds):
+    """Add one sample (in seconds) to a stage's rolling window"""
+    with latency_lock:
+        latency_samples[stage].append(seconds)
+
+
+def record_first_byte(seq, timing):
+    """Record publish -> first byte latency, once per frame (the first client to send it wins)"""
+    global first_sent_seq
+    if not timing:
+        return
+    now = time.time()
+    with latency_lock:
+        if seq <= first_sent_seq:
+            return
+        first_sent_seq = seq
+        latency_samples["first_byte"].append(now - timing["published_at"])
+        latency_samples["end_to_end"].append(now - timing["captured_at"])
+
+
+def latency_summary():
+    """p50/p95/p99/max in milliseconds for every stage"""
+    with latency_lock:
+        snapshot = {stage: sorted(samples) for stage, samples in latency_samples.items()}
+
+    def pct(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000.0, 1)
+
+    summary = {}
+    for stage, values in snapshot.items():
+        if not values:
+            summary[stage] = {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+            continue
+        summary[stage] = {
+            "count": len(values),
+            "p50_ms": pct(values, 50),
+            "p95_ms": pct(values, 95),
+            "p99_ms": pct(values, 99),
+            "max_ms": round(values[-1] * 1000.0, 1)
+        }
+    return summary
+
+
 # ========= CALLBACK =========
 
-def on_prediction(predictions: dict, video_frame: VideoFrame):
-    global last_frame, last_detection_time, last_labels, stable_labels
-    global black_frame_count, blackout_threshold, last_blackout_time
-    global threat_detections, recording_active
+def has_frame_consumers():
+    """True if an /ai_feed client is connected or a recording is running"""
+    return stream_stats["clients"] > 0 or recording_active
+
+
+def annotate_frame(frame, detections, labels, feed):
+    """Draw boxes, labels and the active feed banner on a copy of `frame`"""
+    annotated = box_annotator.annotate(scene=frame.copy(), detections=detections)
+
+    # Annotate with labels (object name + confidence) - only if we have matching labels
+    if len(labels) == len(detections) and len(detections) > 0:
+        annotated = label_annotator.annotate(scene=annotated, detections=detections, labels=labels)
+    elif len(detections) > 0:
+        # If labels don't match, create basic labels from detections
+        fallback_labels = [f"Object {int(conf * 100)}%" for conf in detections.confidence]
+        annotated = label_annotator.annotate(scene=annotated, detections=detections, labels=fallback_labels)
+
+    cv2.putText(annotated, f"ACTIVE FEED: {feed.upper()}",
+                (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+    return annotated
+
 
+def on_prediction(predictions: dict, video_frame: VideoFrame):
+    """InferencePipeline callback: only measure FPS and hand the frame to the frame worker"""
+    global last_frame_arrival
     # --- FPS calculation (rolling window) ---
     now = time.time()
+    last_frame_arrival = now
     _frame_times.append(now)
     if len(_frame_times) >= 2:
         duration = _frame_times[-1] - _frame_times[0]
         if duration > 0:
             health["fps"] = round((len(_frame_times)-1) / duration, 2)
 
-    # === BLACKOUT DETECTION ===
-    frame = video_frame.image
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    brightness = gray.mean()
-
-    if brightness < 10:
-        black_frame_count += 1
-        if last_blackout_time is None:
-            last_blackout_time = time.time()
-        if time.time() - last_blackout_time > blackout_threshold:
-            add_log("BLACKOUT_DETECTED", "⚠️ Screen blackout detected for 5s — triggering failover...")
-            handle_blackout_failover()
-    else:
-        black_frame_count = 0
-        last_blackout_time = None
+    enqueue_frame((video_frame.image, predictions, now, video_frame.frame_timestamp.timestamp()))
+
+
+def enqueue_frame(item):
+    """Put (frame, predictions, timestamp, capture timestamp) on the frame queue, applying FRAME_QUEUE_DROP_POLICY when full"""
+    with frame_queue_lock:
+        frame_queue_stats["enqueued"] += 1
+
+    if FRAME_QUEUE_DROP_POLICY == "block":
+        frame_queue.put(item)
+    elif FRAME_QUEUE_DROP_POLICY == "drop_newest":
+        try:
+            frame_queue.put_nowait(item)
+        except queue.Full:
+            with frame_queue_lock:
+                frame_queue_stats["dropped"] += 1
+    else:  # drop_oldest
+        while True:
+            try:
+                frame_queue.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    frame_queue.get_nowait()
+                    frame_queue.task_done()
+                    with frame_queue_lock:
+                        frame_queue_stats["dropped"] += 1
+                except queue.Empty:
+                    pass
+
+    depth = frame_queue.qsize()
+    with frame_queue_lock:
+        if depth > frame_queue_stats["max_depth"]:
+            frame_queue_stats["max_depth"] = depth
+
+
+def frame_worker():
+    """Drain the frame queue: blackout check, threat logic, annotation and publishing"""
+    while True:
+        frame, predictions, received_at, captured_at = frame_queue.get()
+        try:
+            process_frame(frame, predictions, received_at, captured_at)
+        except Exception as e:
+            add_log("FRAME_WORKER_ERROR", f"Error processing frame: {str(e)}")
+        finally:
+            frame_queue.task_done()
+            with frame_queue_lock:
+                frame_queue_stats["processed"] += 1
+
+
+def ensure_frame_worker():
+    """Start the frame worker thread once per process"""
+    global frame_worker_thread
+    with frame_queue_lock:
+        if frame_worker_thread is None or not frame_worker_thread.is_alive():
+            frame_worker_thread = threading.Thread(target=frame_worker, daemon=True)
+            frame_worker_thread.start()
+
+
+def process_frame(frame, predictions, received_at, captured_at):
+    """Everything on_prediction used to do inline, run on the frame worker thread"""
+    global last_detection_time, last_labels, stable_labels
+    global threat_detections, recording_active
+
+    started_at = time.time()
+    record_latency("inference", received_at - captured_at)
+    record_latency("queue_wait", started_at - received_at)
+
+    # === BLACKOUT / FROZEN FEED DETECTION ===
+    signal_failure = check_feed_signal(frame, received_at)
+    if signal_failure:
+        add_log("BLACKOUT_DETECTED", f"⚠️ Feed {signal_failure} detected — triggering failover...")
+        handle_blackout_failover(signal_failure)
 
     # Filter out low-confidence predictions
     min_conf = 0.55
     detections = sv.Detections.from_inference(predictions)
-    
-    # Create mask for high-confidence detections
-    confidence_mask = detections.confidence > min_conf
-    detections = detections[confidence_mask]
-    
-    # Get predictions list and filter by confidence
-    predictions_list = predictions.get("predictions", [])
-    high_conf_predictions = [p for p in predictions_list if p.get("confidence", 0) > min_conf]
-    
-    # Create labels that match the filtered detections
-    # The order should match since both are filtered by the same confidence threshold
-    labels = []
-    class_names = []
-    
-    for i, pred in enumerate(high_conf_predictions):
-        class_name = pred.get("class", "unknown")
-        confidence = pred.get("confidence", 0)
-        # Format label as "ClassName Confidence%"
-        label_text = f"{class_name} {int(confidence * 100)}%"
-        labels.append(label_text)
-        class_names.append(class_name)
-    
-    # If there's still a mismatch, create labels from detections confidence array
-    # This ensures labels always match detections
-    if len(labels) != len(detections):
-        labels = []
-        class_names = []
-        # Use predictions to get class names, but ensure we match detections count
-        pred_index = 0
-        for i in range(len(detections)):
-            # Get confidence from detections
-            conf = float(detections.confidence[i])
-            
-            # Try to get class name from predictions
-            if pred_index < len(high_conf_predictions):
-                class_name = high_conf_predictions[pred_index].get("class", "object")
-                pred_index += 1
-            elif pred_index < len(predictions_list):
-                # Fallback to any prediction if available
-                class_name = predictions_list[pred_index].get("class", "object")
-                pred_index += 1
-            else:
-                class_name = "object"
-            
-            label_text = f"{class_name} {int(conf * 100)}%"
-            labels.append(label_text)
-            class_names.append(class_name)
+    detections = detections[detections.confidence > min_conf]
+
+    # Class names and threat kinds come from the per-class-id lookup, so labels
+    # always line up with detections and no per-frame string matching is needed
+    class_ids = detections.class_id
+    register_classes(class_ids, predictions)
+    class_names = class_name_lut[class_ids].tolist()
+    threat_mask = class_kind_lut[class_ids] == CLASS_KIND_THREAT
+    labels = [f"{name} {int(conf * 100)}%" for name, conf in zip(class_names, detections.confidence)]
 
     # === THREAT DETECTION & AUTO-RECORDING ===
-    if is_threat_detected(class_names):
-        # Get detected threat objects (only actual threats, explicitly exclude person)
-        labels_lower = [label.lower() for label in class_names]
-        threat_objects = []
-        for label in class_names:
-            label_lower = label.lower()
-            
-            # Explicitly skip non-threat objects like person
-            is_non_threat = any(non_threat in label_lower for non_threat in NON_THREAT_OBJECTS)
-            if is_non_threat:
-                continue
-            
-            # Check if this label matches any threat object
-            for threat in THREAT_OBJECTS:
-                if threat in label_lower:
-                    threat_objects.append(label)
-                    break
-        
-        # Only count if we have actual threat objects (not person)
-        if threat_objects:
-            now = time.time()
-            new_threat_detected = False
-            
-            # Check each threat object and only count if it's a new detection (cooldown expired)
-            for threat_obj in threat_objects:
-                threat_key = threat_obj.lower()
-                last_detection_time = threat_detection_cooldown.get(threat_key, 0)
-                
-                # Only count if this threat type hasn't been detected recently
-                if now - last_detection_time >= THREAT_COOLDOWN_SECONDS:
-                    threat_detections.append(now)
-                    threat_detection_cooldown[threat_key] = now
-                    new_threat_detected = True
-                    add_log("THREAT_COUNTED", f"Threat '{threat_obj}' counted (Total in window: {len([t for t in threat_detections if now - t <= THREAT_DETECTION_WINDOW])})")
-            
-            # Only create alert and check threshold if this is a new detection
-            if new_threat_detected:
-                # Get average confidence for threats
-                threat_confidences = [p.get("confidence", 0) for p in predictions.get("predictions", []) 
-                                     if p.get("confidence", 0) > min_conf and any(threat in p.get("class", "").lower() for threat in THREAT_OBJECTS)]
-                avg_confidence = sum(threat_confidences) / len(threat_confidences) if threat_confidences else 0
-                
-                # Create critical alert for threat detection
-                add_alert(
-                    type="critical",
-                    title="Threat Detected - Security Alert",
-                    description=f"Potentially dangerous objects detected: {', '.join(threat_objects)}",
-                    detected_objects=threat_objects,
-                    camera=current_feed.upper() + " Camera",
-                    confidence=round(avg_confidence * 100, 1)
-                )
-                
-                # Check if threshold is met and not already recording
-                if not recording_active and check_threat_threshold():
-                    add_log("RECORDING_TRIGGER", f"Recording triggered: {len([t for t in threat_detections if now - t <= THREAT_DETECTION_WINDOW])} threat detections in last {THREAT_DETECTION_WINDOW}s")
-                    start_recording()
-                    # Clear detections after starting recording to prevent immediate re-trigger
-                    threat_detections.clear()
-                    threat_detection_cooldown.clear()
+    if threat_mask.any():
+        threat_objects = [class_names[i] for i in np.flatnonzero(threat_mask)]
+        now = received_at
+        new_threat_detected = False
+
+        # Check each threat object and only count if it's a new detection (cooldown expired)
+        for threat_obj in threat_objects:
+            threat_key = threat_obj.lower()
+            last_counted = threat_detection_cooldown.get(threat_key, 0)
+
+            # Only count if this threat type hasn't been detected recently
+            if now - last_counted >= THREAT_COOLDOWN_SECONDS:
+                threat_detections.append(now)
+                threat_detection_cooldown[threat_key] = now
+                new_threat_detected = True
+                add_log("THREAT_COUNTED", f"Threat '{threat_obj}' counted (Total in window: {len([t for t in threat_detections if now - t <= THREAT_DETECTION_WINDOW])})")
+
+        # Only create alert and check threshold if this is a new detection
+        if new_threat_detected:
+            avg_confidence = float(detections.confidence[threat_mask].mean())
+
+            # Create critical alert for threat detection
+            add_alert(
+                type="critical",
+                title="Threat Detected - Security Alert",
+                description=f"Potentially dangerous objects detected: {', '.join(threat_objects)}",
+                detected_objects=threat_objects,
+                camera=current_feed.upper() + " Camera",
+                confidence=round(avg_confidence * 100, 1)
+            )
+
+            # Keep an active session going, otherwise check if the threshold is met
+            if recording_active:
+                extend_recording(now, threat_objects)
+            elif check_threat_threshold():
+                add_log("RECORDING_TRIGGER", f"Recording triggered: {len([t for t in threat_detections if now - t <= THREAT_DETECTION_WINDOW])} threat detections in last {THREAT_DETECTION_WINDOW}s")
+                start_recording(threat_objects)
+                # Clear detections after starting recording to prevent immediate re-trigger
+                threat_detections.clear()
+                threat_detection_cooldown.clear()
 
     # Stabilize detections
     if class_names == last_labels:
         stable_labels = class_names
     last_labels = class_names
 
-    # Annotate frame with bounding boxes and labels
-    annotated = box_annotator.annotate(scene=frame.copy(), detections=detections)
-    
-    # Annotate with labels (object name + confidence) - only if we have matching labels
-    if len(labels) == len(detections) and len(detections) > 0:
-        annotated = label_annotator.annotate(scene=annotated, detections=detections, labels=labels)
-    elif len(detections) > 0:
-        # If labels don't match, create basic labels from detections
-        fallback_labels = [f"Object {int(conf * 100)}%" for conf in detections.confidence]
-        annotated = label_annotator.annotate(scene=annotated, detections=detections, labels=fallback_labels)
+    # Only draw when someone will see the result; otherwise keep the raw frame
+    # and detections so the boxes can be drawn on demand later
+    if has_frame_consumers():
+        annotated = annotate_frame(frame, detections, labels, current_feed)
+        annotation_stats["annotated"] += 1
+    else:
+        annotated = None
+        annotation_stats["skipped"] += 1
 
-    cv2.putText(annotated, f"ACTIVE FEED: {current_feed.upper()}",
-                (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+    add_preroll_frame(camera_key(current_camera_url), frame, detections, labels, current_feed, captured_at)
 
-    with lock:
-        last_frame = annotated
+    annotated_at = time.time()
+    record_latency("annotation", annotated_at - started_at)
+    publish_frame(annotated, (frame, detections, labels, current_feed), captured_at)
+    record_latency("publish", last_timing["published_at"] - annotated_at)
+    note_failover_frame(received_at, inferred=not predictions.get("standby_handoff"))
 
     # Log detection only every 3 seconds
     if class_names and (time.time() - last_detection_time > 3):
@@ -614,7 +864,12 @@ def sample_tcp_metrics(url, attempts=6, timeout=1.5):
             failures += 1
         time.sleep(0.1)
 
-    packet_loss = (failures / attempts) * 100.0
+    return summarize_rtts(rtts, failures)
+
+
+def summarize_rtts(rtts, failures):
+    """(latency, jitter, packet loss %) from successful round trips and failed connects"""
+    packet_loss = (failures / (len(rtts) + failures)) * 100.0
     latency = round(statistics.mean(rtts), 1) if rtts else None
     jitter = round(statistics.pstdev(rtts), 1) if len(rtts) > 1 else (0.0 if rtts else None)
     return latency, jitter, packet_loss
@@ -648,12 +903,121 @@ def health_sampler(poll_sec=5):
         time.sleep(poll_sec)
 
 
+# ========= CAMERA HEALTH TABLE =========
+# Every configured camera (primary + backup_cameras.json) is sampled in the
+# background so its health is known before the feed ever fails over to it.
+# All cameras are probed concurrently as coroutines on one asyncio loop that
+# runs in a single thread.
+CAMERA_HEALTH_ENABLED = True
+CAMERA_HEALTH_INTERVAL = 5  # seconds between sampling rounds
+CAMERA_HEALTH_ATTEMPTS = 6  # TCP connects per camera per round
+CAMERA_HEALTH_TIMEOUT = 1.5  # seconds per connect
+CAMERA_HEALTH_HISTORY = 120  # samples kept per camera (10 minutes at 5s)
+CAMERA_HEALTH_DEFAULT_SAMPLES = 20  # samples returned by /health/cameras unless ?history= says otherwise
+
+camera_health_lock = threading.Lock()
+camera_health = {}  # camera key -> name, label and rolling sample history
+camera_health_thread = None
+camera_health_stop = threading.Event()
+
+
+async def tcp_rtt_async(host, port, timeout):
+    """Round trip of one TCP connect in ms, or None when it fails"""
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except Exception:
+        return None
+    rtt = (time.perf_counter() - start) * 1000.0
+    writer.close()
+    return rtt
+
+
+async def sample_camera_async(url, attempts=CAMERA_HEALTH_ATTEMPTS, timeout=CAMERA_HEALTH_TIMEOUT):
+    """Async counterpart of sample_tcp_metrics: (latency, jitter, loss)"""
+    host, port = _host_port_from_url(url)
+    rtts = []
+    failures = 0
+    for _ in range(attempts):
+        rtt = await tcp_rtt_async(host, port, timeout) if host else None
+        if rtt is None:
+            failures += 1
+        else:
+            rtts.append(rtt)
+        await asyncio.sleep(0.1)
+    return summarize_rtts(rtts, failures)
+
+
+async def camera_health_round():
+    """Sample every configured camera concurrently and append to its history"""
+    cameras = get_all_camera_urls()
+    results = await asyncio.gather(*(sample_camera_async(camera["url"]) for camera in cameras))
+    now = time.time()
+    with camera_health_lock:
+        keys = set()
+        for camera, (latency, jitter, loss) in zip(cameras, results):
+            key = camera_key(camera["url"])
+            keys.add(key)
+            entry = camera_health.setdefault(key, {"history": deque(maxlen=CAMERA_HEALTH_HISTORY)})
+            entry.update(name=camera["name"], label=camera["label"], id=camera.get("id"))
+            entry["history"].append({
+                "at": now,
+                "latency_ms": latency,
+                "jitter_ms": jitter,
+                "loss_pct": round(loss, 1),
+                "status": grade_status(latency, jitter, loss)
+            })
+        for key in set(camera_health) - keys:
+            del camera_health[key]  # Camera removed from the configuration
+
+
+async def camera_health_loop():
+    while not camera_health_stop.is_set():
+        started = time.time()
+        try:
+            await camera_health_round()
+        except Exception as e:
+            add_log("CAMERA_HEALTH_ERROR", f"Health round failed: {str(e)}")
+        await asyncio.sleep(max(0.0, CAMERA_HEALTH_INTERVAL - (time.time() - started)))
+
+
+def camera_health_prober():
+    """Thread body: run the sampling loop on its own event loop"""
+    add_log("CAMERA_HEALTH_START", "Background camera health prober started")
+    asyncio.run(camera_health_loop())
+
+
+def ensure_camera_health_prober():
+    """Start the prober thread once per stream session"""
+    global camera_health_thread
+    with camera_health_lock:
+        camera_health_stop.clear()
+        if camera_health_thread is None or not camera_health_thread.is_alive():
+            camera_health_thread = threading.Thread(target=camera_health_prober, daemon=True)
+            camera_health_thread.start()
+
+
+def summarize_camera_health(history):
+    """Rolling averages over a camera's sample history"""
+    up = [s for s in history if s["latency_ms"] is not None]
+    return {
+        "samples": len(history),
+        "availability_pct": round(100.0 * len(up) / len(history), 1) if history else None,
+        "latency_ms": round(statistics.mean(s["latency_ms"] for s in up), 1) if up else None,
+        "jitter_ms": round(statistics.mean(s["jitter_ms"] for s in up), 1) if up else None,
+        "loss_pct": round(statistics.mean(s["loss_pct"] for s in history), 1) if history else None
+    }
+
+
 #======= video recording ============
 
 
 # ========= RECORDING CONFIG =========
 RECORDINGS_DIR = "recordings"
-RECORDING_DURATION = 60  # 1 minute in seconds
+RECORDING_DURATION = 60  # 1 minute in seconds, the minimum session length
+RECORDING_POSTROLL_SECONDS = 15  # keep recording this long after the last counted threat
+RECORDING_MAX_DURATION = 600  # cap on a threat-extended session
+RECORDING_SEGMENT_SECONDS = 60  # rotate long sessions into parts of this length
 THREAT_DETECTION_WINDOW = 10  # seconds
 THREAT_DETECTION_THRESHOLD = 2  # detections needed to trigger recording (3 detections within 10 seconds)
 
@@ -667,31 +1031,84 @@ THREAT_OBJECTS = [
 # Objects to explicitly exclude from threat detection
 NON_THREAT_OBJECTS = ["person", "people", "human"]
 
-# Create recordings directory if it doesn't exist
-os.makedirs(RECORDINGS_DIR, exist_ok=True)
+# Per-class-id lookup tables, filled once per class by register_classes()
+CLASS_KIND_NEUTRAL = 0
+CLASS_KIND_THREAT = 1
+CLASS_KIND_NON_THREAT = 2
+CLASS_KIND_NAMES = {CLASS_KIND_NEUTRAL: "neutral", CLASS_KIND_THREAT: "threat", CLASS_KIND_NON_THREAT: "non-threat"}
+class_lut_lock = threading.Lock()
+class_name_lut = np.array([], dtype=object)  # class_id -> class name
+class_kind_lut = np.array([], dtype=np.int8)  # class_id -> CLASS_KIND_*
+class_known_lut = np.array([], dtype=bool)  # class_id -> already classified
 
 # ========= RECORDING GLOBALS =========
 recording_active = False
 recording_thread = None
 video_writer = None
 recording_start_time = None
+recording_deadline = None  # when the active session ends unless extended again
+recording_threats = set()  # threat classes seen during the active session
+RECORDING_FPS = 20.0  # nominal frame rate of recorded clips
+RECORDING_OUT_OF_PROCESS = True  # encode clips in a separate process (video_encoder.py)
+RECORDING_ENCODER_SLOTS = 4  # shared-memory frame slots between recorder and encoder
+last_recording_stats = None  # real vs nominal frame rate of the last finished clip
 threat_detections = deque(maxlen=100)  # Store timestamps of threat detections
 threat_detection_cooldown = {}  # Track last detection time per threat type to avoid counting same threat multiple times
 recording_lock = threading.Lock()
 THREAT_COOLDOWN_SECONDS = 3  # Minimum seconds between counting the same threat type again
 
+# Pre-event ring buffer: recent frames per camera, flushed into the start of each recording
+PREROLL_SECONDS = 5  # 0 disables
+PREROLL_FPS = 10  # max frames per second kept in the buffer
+PREROLL_JPEG_QUALITY = 70
+PREROLL_MAX_BYTES = 32 * 1024 * 1024  # per camera
+preroll_lock = threading.Lock()
+preroll_buffers = {}  # camera -> {"frames": deque of (captured_at, jpeg, detections, labels, feed), "bytes", "last_added"}
+
 
 # ========= THREAT DETECTION CHECKER =========
-def is_threat_detected(labels):
-    """Check if any detected labels match threat objects"""
-    if not labels:
-        return False
-    
-    labels_lower = [label.lower() for label in labels]
-    for threat in THREAT_OBJECTS:
-        if any(threat in label for label in labels_lower):
-            return True
-    return False
+def classify_class_name(name):
+    """Classify a model class name as threat, non-threat or neutral"""
+    name_lower = name.lower()
+    # Explicitly skip non-threat objects like person
+    if any(non_threat in name_lower for non_threat in NON_THREAT_OBJECTS):
+        return CLASS_KIND_NON_THREAT
+    if any(threat in name_lower for threat in THREAT_OBJECTS):
+        return CLASS_KIND_THREAT
+    return CLASS_KIND_NEUTRAL
+
+
+def register_classes(class_ids, predictions):
+    """Add any class ids not seen before to the lookup tables.
+
+    The model's class set is fixed, so after the first few frames this is a
+    single vectorized check per frame.
+    """
+    global class_name_lut, class_kind_lut, class_known_lut
+    if len(class_ids) == 0:
+        return
+    if class_ids.max() < len(class_known_lut) and class_known_lut[class_ids].all():
+        return
+
+    names = {}
+    for pred in predictions.get("predictions", []):
+        if "class_id" in pred:
+            names[int(pred["class_id"])] = pred.get("class", "object")
+
+    with class_lut_lock:
+        size = max(len(class_known_lut), int(class_ids.max()) + 1)
+        if size > len(class_known_lut):
+            grow = size - len(class_known_lut)
+            class_name_lut = np.concatenate([class_name_lut, np.full(grow, "object", dtype=object)])
+            class_kind_lut = np.concatenate([class_kind_lut, np.zeros(grow, dtype=np.int8)])
+            class_known_lut = np.concatenate([class_known_lut, np.zeros(grow, dtype=bool)])
+        for class_id in np.unique(class_ids):
+            if class_known_lut[class_id] or class_id not in names:
+                continue
+            class_name_lut[class_id] = names[class_id]
+            class_kind_lut[class_id] = classify_class_name(names[class_id])
+            class_known_lut[class_id] = True
+            add_log("CLASS_REGISTERED", f"Model class {class_id} '{names[class_id]}' classified as {CLASS_KIND_NAMES[class_kind_lut[class_id]]}")
 
 
 def check_threat_threshold():
@@ -706,88 +1123,770 @@ def check_threat_threshold():
     return len(threat_detections) >= THREAT_DETECTION_THRESHOLD
 
 
+# ========= PRE-EVENT BUFFER =========
+def add_preroll_frame(camera, frame, detections, labels, feed, captured_at):
+    """Keep a JPEG-compressed copy of recent raw frames (plus detections) per camera"""
+    if PREROLL_SECONDS <= 0:
+        return
+    with preroll_lock:
+        buffer = preroll_buffers.setdefault(camera, {"frames": deque(), "bytes": 0, "last_added": 0.0})
+        if captured_at - buffer["last_added"] < 1.0 / PREROLL_FPS:
+            return
+        buffer["last_added"] = captured_at
+
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, PREROLL_JPEG_QUALITY])
+    if not ok:
+        return
+    jpeg = jpeg.tobytes()
+
+    with preroll_lock:
+        frames = buffer["frames"]
+        frames.append((captured_at, jpeg, detections, labels, feed))
+        buffer["bytes"] += len(jpeg)
+        # Evict by age, then by memory cap
+        while frames and (captured_at - frames[0][0] > PREROLL_SECONDS or buffer["bytes"] > PREROLL_MAX_BYTES):
+            buffer["bytes"] -= len(frames.popleft()[1])
+
+
+def get_preroll_frames(camera):
+    """Snapshot of the last PREROLL_SECONDS of buffered frames for a camera, oldest first"""
+    cutoff = time.time() - PREROLL_SECONDS
+    with preroll_lock:
+        buffer = preroll_buffers.get(camera)
+        return [entry for entry in buffer["frames"] if entry[0] >= cutoff] if buffer else []
+
+
+def preroll_summary():
+    """Per-camera memory footprint of the pre-event buffer"""
+    with preroll_lock:
+        return {
+            camera: {
+                "frames": len(buffer["frames"]),
+                "bytes": buffer["bytes"],
+                "seconds": round(buffer["frames"][-1][0] - buffer["frames"][0][0], 1) if buffer["frames"] else 0.0
+            }
+            for camera, buffer in preroll_buffers.items()
+        }
+
+
+# ========= RECORDINGS CATALOG =========
+CATALOG_DB = os.path.join(RECORDINGS_DIR, "catalog.db")
+RECORDINGS_PAGE_SIZE = 100  # default /recordings page size
+RECORDINGS_MAX_PAGE_SIZE = 1000
+RECORDING_PART_PATTERN = re.compile(r"^(?P<event>.+)_part(?P<part>\d+)\.(mp4|avi)$")
+CATALOG_SORT_COLUMNS = {"created": "created", "size": "size_bytes", "duration": "duration_seconds",
+                        "filename": "filename", "camera": "camera"}
+# Display title of a recording: "threat_recording_20241206_153045_part01.mp4" is shown as
+# "Threat Detection Event 20241206 153045 part01". Computed in SQL so ?q= searches what the UI shows.
+RECORDING_TITLE_SQL = ("REPLACE(REPLACE(SUBSTR(filename, 1, LENGTH(filename) - 4), '_', ' '), "
+                       "'threat recording', 'Threat Detection Event')")
+
+catalog_lock = threading.Lock()
+catalog_db = None  # opened by init_app()
+CATALOG_SCHEMA = """
+    PRAGMA journal_mode=WAL;
+    CREATE TABLE IF NOT EXISTS recordings (
+        filename TEXT PRIMARY KEY,
+        event_id TEXT,
+        part INTEGER,
+        created REAL,
+        size_bytes INTEGER,
+        duration_seconds REAL,
+        frame_count INTEGER,
+        camera TEXT,
+        threats TEXT
+    );
+    CREATE INDEX IF NOT EXISTS recordings_created ON recordings (created);
+    CREATE INDEX IF NOT EXISTS recordings_event ON recordings (event_id, part);
+    CREATE INDEX IF NOT EXISTS recordings_camera ON recordings (camera, created);
+    CREATE TABLE IF NOT EXISTS detections (
+        filename TEXT NOT NULL,
+        captured_at REAL,
+        frame_offset INTEGER,
+        class_name TEXT,
+        confidence REAL,
+        x1 REAL, y1 REAL, x2 REAL, y2 REAL
+    );
+    CREATE INDEX IF NOT EXISTS detections_class ON detections (class_name, confidence);
+    CREATE INDEX IF NOT EXISTS detections_time ON detections (captured_at);
+    CREATE INDEX IF NOT EXISTS detections_file ON detections (filename);
+    CREATE TABLE IF NOT EXISTS exports (
+        id TEXT PRIMARY KEY,
+        camera TEXT,
+        range_start REAL,
+        range_end REAL,
+        filename TEXT,
+        status TEXT,  -- queued, running, done or failed
+        progress REAL,
+        segments INTEGER,
+        reencode INTEGER,
+        error TEXT,
+        size_bytes INTEGER,
+        created_at REAL,
+        finished_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS exports_status ON exports (status, created_at);
+"""
+# Columns added after the first release of the catalog
+CATALOG_EXTRA_COLUMNS = {
+    "preview_ready": "INTEGER NOT NULL DEFAULT 0",  # 0 pending, 2 generating, 1 ready, -1 failed
+    "codec": "TEXT",
+    "transcode_status": "TEXT"  # pending, running, done, failed or skipped (no ffmpeg)
+}
+
+
+def open_catalog():
+    """Connect to the catalog, creating or migrating the schema as needed"""
+    db = sqlite3.connect(CATALOG_DB, timeout=10, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.executescript(CATALOG_SCHEMA)
+    for column, declaration in CATALOG_EXTRA_COLUMNS.items():
+        if column not in {row["name"] for row in db.execute("PRAGMA table_info(recordings)")}:
+            db.execute(f"ALTER TABLE recordings ADD COLUMN {column} {declaration}")
+    return db
+
+
+def catalog_add(filename, event_id=None, part=1, duration=None, frames=None, camera=None, threats=(), created=None):
+    """Insert or update a finished recording in the catalog"""
+    filepath = os.path.join(RECORDINGS_DIR, filename)
+    with catalog_lock, catalog_db:
+        catalog_db.execute(
+            "INSERT OR REPLACE INTO recordings (filename, event_id, part, created, size_bytes, duration_seconds, "
+            "frame_count, camera, threats) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (filename, event_id or os.path.splitext(filename)[0], part,
+             created if created is not None else os.path.getctime(filepath), os.path.getsize(filepath),
+             duration, frames, camera, json.dumps(sorted(threats)))
+        )
+
+
+def probe_recording(filepath):
+    """(duration_seconds, frame_count) read from the file header, or (None, None)"""
+    cap = cv2.VideoCapture(filepath)
+    try:
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if frames <= 0 or fps <= 0:
+            return None, None
+        return round(frames / fps, 1), frames
+    finally:
+        cap.release()
+
+
+def rescan_catalog():
+    """Bring the catalog in line with RECORDINGS_DIR: add unknown files, drop missing ones,
+    and put jobs interrupted by the last shutdown back to pending.
+
+    Only safe while no worker is running jobs, so it is called once per server
+    start by startup_rescan().
+    """
+    try:
+        on_disk = {f for f in os.listdir(RECORDINGS_DIR) if f.endswith(('.avi', '.mp4'))}
+        with catalog_lock:
+            known = {row["filename"] for row in catalog_db.execute("SELECT filename FROM recordings")}
+        missing = known - on_disk
+        if missing:
+            with catalog_lock, catalog_db:
+                catalog_db.executemany("DELETE FROM recordings WHERE filename = ?", [(f,) for f in missing])
+                catalog_db.executemany("DELETE FROM detections WHERE filename = ?", [(f,) for f in missing])
+            for path in (p for f in missing for p in (*preview_paths(f), sidecar_path(f))):
+                if os.path.exists(path):
+                    os.remove(path)
+        for filename in sorted(on_disk - known):
+            match = RECORDING_PART_PATTERN.match(filename)
+            duration, frames = probe_recording(os.path.join(RECORDINGS_DIR, filename))
+            catalog_add(filename, match.group("event") if match else None,
+                        int(match.group("part")) if match else 1, duration, frames)
+            if os.path.exists(sidecar_path(filename)):
+                with open(sidecar_path(filename)) as f:
+                    sidecar = json.load(f)
+                index_detections(filename, sidecar["start"], sidecar["detections"])
+        add_log("CATALOG_RESCAN", f"Recordings catalog: {len(on_disk - known)} added, {len(missing)} removed")
+        with catalog_lock, catalog_db:
+            # Previews that were being generated or failed are retried
+            catalog_db.execute("UPDATE recordings SET preview_ready = 0 WHERE preview_ready IN (2, -1)")
+            # 'running' means the previous process stopped mid-job; the original is still intact.
+            # Clips skipped for lack of ffmpeg are retried once it is installed.
+            retry = ("running", "skipped") if FFMPEG_BIN else ("running",)
+            catalog_db.execute(
+                f"UPDATE recordings SET transcode_status = 'pending' WHERE transcode_status IS NULL "
+                f"OR transcode_status IN ({', '.join('?' * len(retry))})", retry)
+            catalog_db.execute("UPDATE exports SET status = 'queued', progress = 0 WHERE status = 'running'")
+    except Exception as e:
+        add_log("CATALOG_ERROR", f"Catalog rescan failed: {e}")
+
+
+def like_pattern(term):
+    """`%term%` for a LIKE ... ESCAPE '\\' clause, with the term's own wildcards escaped"""
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def query_catalog(filters, sort="created", order="desc", limit=RECORDINGS_PAGE_SIZE, offset=0):
+    """One page of catalog rows matching `filters`, plus the total match count"""
+    clauses, params = [], []
+    if filters.get("camera"):
+        clauses.append("camera = ?")
+        params.append(filters["camera"])
+    if filters.get("event_id"):
+        clauses.append("event_id = ?")
+        params.append(filters["event_id"])
+    if filters.get("threat"):
+        clauses.append("threats LIKE ?")
+        params.append(f'%"{filters["threat"]}"%')
+    if filters.get("since") is not None:
+        clauses.append("created >= ?")
+        params.append(filters["since"])
+    if filters.get("until") is not None:
+        clauses.append("created <= ?")
+        params.append(filters["until"])
+    if filters.get("min_duration") is not None:
+        clauses.append("duration_seconds >= ?")
+        params.append(filters["min_duration"])
+    if filters.get("q"):
+        # Free-text search over the displayed title, the file name and camera; LIKE ignores ASCII case
+        clauses.append(f"({RECORDING_TITLE_SQL} LIKE ? ESCAPE '\\' OR filename LIKE ? ESCAPE '\\' "
+                       f"OR camera LIKE ? ESCAPE '\\')")
+        params.extend([like_pattern(filters["q"])] * 3)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    # Column and direction come from whitelists, never from the request directly
+    order_by = f"{CATALOG_SORT_COLUMNS[sort]} {'ASC' if order == 'asc' else 'DESC'}, part DESC"
+    with catalog_lock:
+        total = catalog_db.execute(f"SELECT COUNT(*) FROM recordings {where}", params).fetchone()[0]
+        rows = catalog_db.execute(
+            f"SELECT *, {RECORDING_TITLE_SQL} AS title, "
+            f"(SELECT COUNT(*) FROM detections d WHERE d.filename = recordings.filename) AS detection_count "
+            f"FROM recordings {where} ORDER BY {order_by} LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+    return rows, total
+
+
+# ========= RECORDING PREVIEWS =========
+PREVIEW_POSTER_WIDTH = 480
+PREVIEW_SPRITE_FRAMES = 10  # evenly spaced tiles in the scrub strip
+PREVIEW_SPRITE_TILE_WIDTH = 160
+PREVIEW_JPEG_QUALITY = 75
+PREVIEW_CACHE_SECONDS = 365 * 24 * 3600  # previews never change once written
+
+PREVIEW_POLL_SECONDS = 30  # idle worker looks for pending previews this often (new clips wake it directly)
+
+# Like transcodes, pending previews are catalog rows (preview_ready = 0) claimed by the worker
+preview_wakeup = threading.Event()
+preview_worker_thread = None
+preview_worker_lock = threading.Lock()
+
+
+def preview_paths(filename):
+    """(poster, sprite) paths stored next to a recording"""
+    stem = os.path.join(RECORDINGS_DIR, os.path.splitext(filename)[0])
+    return f"{stem}.poster.jpg", f"{stem}.sprite.jpg"
+
+
+def resize_to_width(frame, width):
+    return cv2.resize(frame, (width, max(1, round(frame.shape[0] * width / frame.shape[1]))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def generate_preview(filename):
+    """Write the poster and a horizontal sprite strip of evenly spaced frames; True on success"""
+    cap = cv2.VideoCapture(os.path.join(RECORDINGS_DIR, filename))
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return False
+        tiles = []
+        for i in range(PREVIEW_SPRITE_FRAMES):
+            # Centre of each equal slice, so the first tile isn't the pre-roll's first frame
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((i + 0.5) * frame_count / PREVIEW_SPRITE_FRAMES))
+            ok, frame = cap.read()
+            if ok:
+                tiles.append(frame)
+    finally:
+        cap.release()
+    if not tiles:
+        return False
+
+    poster_path, sprite_path = preview_paths(filename)
+    params = [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY]
+    sprite = np.hstack([resize_to_width(tile, PREVIEW_SPRITE_TILE_WIDTH) for tile in tiles])
+    # Write to temp names and rename, so a half-written preview is never served
+    for path, image in ((poster_path, resize_to_width(tiles[len(tiles) // 2], PREVIEW_POSTER_WIDTH)),
+                        (sprite_path, sprite)):
+        ok, jpeg = cv2.imencode(".jpg", image, params)
+        if not ok:
+            return False
+        with open(path + ".tmp", "wb") as f:
+            f.write(jpeg.tobytes())
+        os.replace(path + ".tmp", path)
+    return True
+
+
+def claim_preview_job():
+    """Move one pending preview to 'generating' (2) and return its filename, or None"""
+    while True:
+        with catalog_lock:
+            row = catalog_db.execute("SELECT filename FROM recordings WHERE preview_ready = 0 "
+                                     "ORDER BY created DESC LIMIT 1").fetchone()
+            if row is None:
+                return None
+            with catalog_db:
+                claimed = catalog_db.execute("UPDATE recordings SET preview_ready = 2 "
+                                             "WHERE filename = ? AND preview_ready = 0", (row["filename"],)).rowcount
+        if claimed:
+            return row["filename"]
+
+
+def preview_worker():
+    """Generate previews for finished recordings, one at a time, off the recording path"""
+    while True:
+        filename = claim_preview_job()
+        if filename is None:
+            preview_wakeup.wait(PREVIEW_POLL_SECONDS)
+            preview_wakeup.clear()
+            continue
+        ready = False
+        try:
+            ready = os.path.exists(os.path.join(RECORDINGS_DIR, filename)) and generate_preview(filename)
+        except Exception as e:
+            add_log("PREVIEW_ERROR", f"Preview for {filename} failed: {e}")
+        with catalog_lock, catalog_db:
+            catalog_db.execute("UPDATE recordings SET preview_ready = ? WHERE filename = ?",
+                               (1 if ready else -1, filename))
+
+
+def ensure_preview_worker():
+    """Start the preview worker on first use"""
+    global preview_worker_thread
+    with preview_worker_lock:
+        if preview_worker_thread is None or not preview_worker_thread.is_alive():
+            preview_worker_thread = threading.Thread(target=preview_worker, daemon=True)
+            preview_worker_thread.start()
+
+
+def queue_preview(filename):
+    """Mark a finished recording for preview generation and wake the worker"""
+    ensure_preview_worker()
+    with catalog_lock, catalog_db:
+        catalog_db.execute("UPDATE recordings SET preview_ready = 0 WHERE filename = ?", (filename,))
+    preview_wakeup.set()
+
+
+# ========= TRANSCODING =========
+FFMPEG_BIN = shutil.which("ffmpeg")
+TRANSCODE_WORKERS = 1  # concurrent ffmpeg jobs
+TRANSCODE_POLL_SECONDS = 30  # idle workers look for pending clips this often (others wake them directly)
+TRANSCODE_FFMPEG_THREADS = 2
+TRANSCODE_TIMEOUT = 600  # seconds per clip
+BROWSER_CODECS = ("avc1", "h264")  # fourccs browsers can play as-is
+
+# The catalog is the job queue: clips wait as 'pending' rows until a worker claims them
+transcode_wakeup = threading.Event()
+transcode_workers = []
+transcode_workers_lock = threading.Lock()
+
+
+def probe_codec(filepath):
+    """FourCC of a file's video stream, lower-case, or None"""
+    cap = cv2.VideoCapture(filepath)
+    try:
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+    return "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00 ").lower() or None
+
+
+def set_transcode_status(filename, status, **columns):
+    with catalog_lock, catalog_db:
+        assignments = ", ".join(f"{column} = ?" for column in ("transcode_status", *columns))
+        catalog_db.execute(f"UPDATE recordings SET {assignments} WHERE filename = ?",
+                           (status, *columns.values(), filename))
+
+
+def transcode_recording(filename):
+    """Rewrite a clip as browser-playable fast-start MP4, replacing the original atomically"""
+    filepath = os.path.join(RECORDINGS_DIR, filename)
+    codec = probe_codec(filepath)
+    if FFMPEG_BIN is None:
+        set_transcode_status(filename, "skipped", codec=codec)
+        return
+    set_transcode_status(filename, "running", codec=codec)
+
+    # H.264 only needs the moov atom moved to the front; anything else is re-encoded
+    if codec in BROWSER_CODECS:
+        video_args = ["-c:v", "copy"]
+    else:
+        video_args = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+                      "-threads", str(TRANSCODE_FFMPEG_THREADS)]
+    # Unique hidden name without an .mp4 suffix, so listings never pick it up
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{filename}.", suffix=".transcoding", dir=RECORDINGS_DIR)
+    os.close(fd)
+    command = [FFMPEG_BIN, "-y", "-v", "error", "-i", filepath, *video_args, "-an",
+               "-movflags", "+faststart", "-f", "mp4", tmp_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip()[-300:] or f"ffmpeg exited with {result.returncode}")
+        os.chmod(tmp_path, 0o644)  # mkstemp creates the file owner-only
+        os.replace(tmp_path, filepath)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        set_transcode_status(filename, "failed")
+        add_log("TRANSCODE_ERROR", f"Transcoding {filename} failed: {e}")
+        return
+    set_transcode_status(filename, "done", codec=probe_codec(filepath), size_bytes=os.path.getsize(filepath))
+    add_log("TRANSCODE_DONE", f"{filename} is now fast-start H.264 ({codec or 'unknown'} source)")
+
+
+def claim_transcode_job():
+    """Move one pending clip to 'running' and return its filename, or None when nothing is pending.
+
+    The status condition in the UPDATE makes the claim atomic, so two workers
+    (or two processes sharing the catalog) never transcode the same clip.
+    """
+    while True:
+        with catalog_lock:
+            row = catalog_db.execute("SELECT filename FROM recordings WHERE transcode_status = 'pending' "
+                                     "ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            with catalog_db:
+                claimed = catalog_db.execute(
+                    "UPDATE recordings SET transcode_status = 'running' "
+                    "WHERE filename = ? AND transcode_status = 'pending'", (row["filename"],)).rowcount
+        if claimed:
+            return row["filename"]
+
+
+def transcode_worker():
+    """Claim pending clips from the catalog and transcode them one after another"""
+    while True:
+        filename = claim_transcode_job()
+        if filename is None:
+            transcode_wakeup.wait(TRANSCODE_POLL_SECONDS)
+            transcode_wakeup.clear()
+            continue
+        try:
+            if os.path.exists(os.path.join(RECORDINGS_DIR, filename)):
+                transcode_recording(filename)
+            else:
+                set_transcode_status(filename, "failed")
+        except Exception as e:
+            set_transcode_status(filename, "failed")
+            add_log("TRANSCODE_ERROR", f"Transcoding {filename} failed: {e}")
+
+
+def ensure_transcode_workers():
+    """Start the transcode worker pool on first use"""
+    with transcode_workers_lock:
+        transcode_workers[:] = [t for t in transcode_workers if t.is_alive()]
+        while len(transcode_workers) < TRANSCODE_WORKERS:
+            worker = threading.Thread(target=transcode_worker, daemon=True)
+            worker.start()
+            transcode_workers.append(worker)
+
+
+def queue_transcode(filename):
+    """Mark a finished clip for post-processing and wake the workers"""
+    ensure_transcode_workers()
+    set_transcode_status(filename, "pending")
+    transcode_wakeup.set()
+
+
+# ========= DETECTION SIDECARS =========
+def sidecar_path(filename):
+    """Per-frame detections file stored next to a recording"""
+    return os.path.join(RECORDINGS_DIR, os.path.splitext(filename)[0] + ".detections.json")
+
+
+def detection_records(detections, captured_at):
+    """(captured_at, class, confidence, x1, y1, x2, y2) for every detection in a frame"""
+    if detections is None or len(detections) == 0:
+        return []
+    names = class_name_lut[detections.class_id].tolist()
+    return [(captured_at, name, round(float(conf), 3), *(round(float(v), 1) for v in box))
+            for name, conf, box in zip(names, detections.confidence, detections.xyxy)]
+
+
+def write_detection_sidecar(filename, start, fps, records):
+    """Write a segment's detections as compact rows [offset_s, frame, class, conf, x1, y1, x2, y2]"""
+    rows = [[round(r[0] - start, 3), int((r[0] - start) * fps), *r[1:]] for r in records]
+    path = sidecar_path(filename)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"filename": filename, "start": start, "fps": fps, "detections": rows}, f,
+                  separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+    return rows
+
+
+def index_detections(filename, start, rows):
+    """Replace a recording's rows in the searchable detections index"""
+    with catalog_lock, catalog_db:
+        catalog_db.execute("DELETE FROM detections WHERE filename = ?", (filename,))
+        catalog_db.executemany(
+            "INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(filename, start + offset, frame, name, conf, x1, y1, x2, y2)
+             for offset, frame, name, conf, x1, y1, x2, y2 in rows]
+        )
+
+
+def search_detections(class_name=None, min_confidence=None, since=None, until=None, camera=None, limit=100):
+    """Clips with matching detections, newest first, with the offset of the first match"""
+    clauses, params = [], []
+    if class_name:
+        # Substring match in any case, so "Gun" finds "gun" and "handgun"
+        clauses.append("LOWER(d.class_name) LIKE ? ESCAPE '\\'")
+        params.append(like_pattern(class_name.lower()))
+    if min_confidence is not None:
+        clauses.append("d.confidence >= ?")
+        params.append(min_confidence)
+    if since is not None:
+        clauses.append("d.captured_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("d.captured_at <= ?")
+        params.append(until)
+    if camera:
+        clauses.append("r.camera = ?")
+        params.append(camera)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with catalog_lock:
+        rows = catalog_db.execute(f"""
+            SELECT d.filename, r.event_id, r.camera, r.created, COUNT(*) AS matches,
+                   MAX(d.confidence) AS max_confidence, MIN(d.captured_at) AS first_match_at,
+                   MIN(d.frame_offset) AS first_frame
+            FROM detections d JOIN recordings r ON r.filename = d.filename
+            {where}
+            GROUP BY d.filename
+            ORDER BY first_match_at DESC
+            LIMIT ?""", params + [limit]).fetchall()
+    return [{
+        "filename": row["filename"],
+        "event_id": row["event_id"],
+        "camera": row["camera"],
+        "matches": row["matches"],
+        "max_confidence": row["max_confidence"],
+        "first_match_at": row["first_match_at"],
+        "first_offset_seconds": round(row["first_match_at"] - row["created"], 2),
+        "first_frame": row["first_frame"]
+    } for row in rows]
+
+
 # ========= RECORDING FUNCTIONS =========
-def start_recording():
+def start_recording(threats=()):
     """Start video recording in a separate thread"""
-    global recording_active, recording_thread
+    global recording_active, recording_thread, recording_start_time, recording_deadline, recording_threats
     
     with recording_lock:
         if recording_active:
             return  # Already recording
         
         recording_active = True
-        add_log("RECORDING_START", f"⚠️ Threat detected! Starting 60-second recording...")
+        recording_threats = set(threats)
+        recording_start_time = time.time()
+        recording_deadline = recording_start_time + RECORDING_DURATION
+        add_log("RECORDING_START", f"⚠️ Threat detected! Starting {RECORDING_DURATION}-second recording...")
         
         recording_thread = threading.Thread(target=record_video, daemon=True)
         recording_thread.start()
 
 
+def extend_recording(now, threats=()):
+    """Push the end of the active session to `now` + post-roll, capped at RECORDING_MAX_DURATION"""
+    global recording_deadline
+    with recording_lock:
+        if not recording_active or recording_start_time is None:
+            return
+        recording_threats.update(threats)
+        deadline = min(max(recording_deadline, now + RECORDING_POSTROLL_SECONDS),
+                       recording_start_time + RECORDING_MAX_DURATION)
+        if deadline > recording_deadline:
+            recording_deadline = deadline
+            add_log("RECORDING_EXTENDED", f"Threat still present, recording until "
+                    f"{int(deadline - recording_start_time)}s")
+
+
+def open_video_writer(filepath, fps, frame_size):
+    """Open an MP4 writer, in an encoder process when enabled, trying H.264 ('avc1') first, then 'mp4v'"""
+    if RECORDING_OUT_OF_PROCESS:
+        try:
+            writer = EncoderProcessWriter(filepath, fps, frame_size, slot_count=RECORDING_ENCODER_SLOTS)
+            if writer.isOpened():
+                add_log("RECORDING_ENCODER", f"Encoding in process {writer.pid} with {writer.codec}")
+                return writer
+            add_log("RECORDING_WARNING", "Encoder process could not open a writer, encoding in-process")
+        except Exception as e:
+            add_log("RECORDING_WARNING", f"Encoder process unavailable ({e}), encoding in-process")
+
+    writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*'avc1'), fps, frame_size)
+    if writer.isOpened():
+        return writer
+    add_log("RECORDING_WARNING", "avc1 codec failed, trying mp4v")
+    writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    if writer.isOpened():
+        return writer
+    add_log("RECORDING_ERROR", "Failed to initialize video writer with both codecs")
+    return None
+
+
 def record_video():
-    """Record video for specified duration"""
-    global video_writer, recording_start_time, recording_active, last_frame
+    """Record the published frame stream, starting with the pre-event buffer.
+
+    The session lasts RECORDING_DURATION and is extended by extend_recording()
+    while threats keep being counted. Footage is rotated into
+    RECORDING_SEGMENT_SECONDS parts named <event_id>_partNN.mp4.
+
+    Frames arrive through a subscriber queue and are placed on a fixed
+    RECORDING_FPS timeline by their capture timestamps: a frame is repeated
+    while the pipeline is slower than the nominal rate and superseded frames
+    are dropped when it is faster, so playback speed matches real time.
+    """
+    global video_writer, recording_active, last_recording_stats
     
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"threat_recording_{timestamp}.mp4"
-    filepath = os.path.join(RECORDINGS_DIR, filename)
+    # Every segment of the session shares the event id
+    event_id = f"threat_recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    # Initialize video writer with MP4 codec (H.264) for browser compatibility
-    # Try 'avc1' (H.264) first, fallback to 'mp4v' if not available
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264 codec for better browser support
-    fps = 20.0
-    frame_size = None
+    fps = RECORDING_FPS
+    segment_slots = max(1, int(RECORDING_SEGMENT_SECONDS * fps))
     video_writer = None
-    recording_start_time = time.time()
-    
-    add_log("RECORDING_FILE", f"Recording to: {filename}")
+    camera = camera_key(current_camera_url)
+    frames_queue = subscribe_frames()
+    preroll = get_preroll_frames(camera)
     
+    add_log("RECORDING_FILE", f"Recording event {event_id} (pre-roll: {len(preroll)} frames)")
+
+    # Timeline state: slot N of the current segment shows whatever frame was
+    # current at clip_start + N / fps
+    clip = {"start": None, "size": None, "slots": 0, "total_slots": 0, "pending": None,
+            "pending_written": False, "last_captured": None, "source_frames": 0, "used_frames": 0,
+            "detections": []}
+    segments = []
+
+    def open_segment():
+        global video_writer
+        filename = f"{event_id}_part{len(segments) + 1:02d}.mp4"
+        segments.append(filename)
+        video_writer = open_video_writer(os.path.join(RECORDINGS_DIR, filename), fps, clip["size"])
+        return video_writer is not None
+
+    def close_segment():
+        global video_writer
+        if video_writer is None:
+            return
+        # Blocks until the encoder has written every queued frame and finalized the file
+        video_writer.release()
+        if getattr(video_writer, "frames_dropped", 0):
+            add_log("RECORDING_WARNING", f"Encoder fell behind, {video_writer.frames_dropped} frames dropped")
+        video_writer = None
+        filepath = os.path.join(RECORDINGS_DIR, segments[-1])
+        if os.path.exists(filepath):
+            metric_inc("recording_bytes_written_total", os.path.getsize(filepath))
+            with recording_lock:
+                threats = set(recording_threats)
+            catalog_add(segments[-1], event_id, len(segments), round(clip["slots"] / fps, 1), clip["slots"],
+                        camera, threats, created=clip["start"])
+            # Detections up to the segment's end belong to it, the rest carry over to the next part
+            segment_end = clip["start"] + clip["slots"] / fps
+            records = [r for r in clip["detections"] if r[0] < segment_end]
+            clip["detections"] = clip["detections"][len(records):]
+            rows = write_detection_sidecar(segments[-1], clip["start"], fps, records)
+            index_detections(segments[-1], clip["start"], rows)
+            queue_preview(segments[-1])
+            queue_transcode(segments[-1])
+
+    def write_slots_until(captured_at):
+        target = int((captured_at - clip["start"]) * fps)
+        while clip["pending"] is not None and clip["slots"] < target:
+            if clip["slots"] >= segment_slots:
+                # Rotate: the next part continues the same timeline
+                close_segment()
+                clip["start"] += clip["slots"] / fps
+                clip["slots"] = 0
+                target = int((captured_at - clip["start"]) * fps)
+                if not open_segment():
+                    return False
+                add_log("RECORDING_SEGMENT", f"Continuing in {segments[-1]}")
+                continue
+            video_writer.write(clip["pending"])
+            clip["slots"] += 1
+            clip["total_slots"] += 1
+            if not clip["pending_written"]:
+                clip["pending_written"] = True
+                clip["used_frames"] += 1
+        return True
+
+    def add_frame(frame, captured_at, detections=None):
+        if clip["start"] is None:
+            clip["start"] = captured_at
+            clip["size"] = (frame.shape[1], frame.shape[0])
+            if not open_segment():
+                return False
+        elif (frame.shape[1], frame.shape[0]) != clip["size"]:
+            # Camera switched mid-recording; the writer needs a fixed size
+            frame = cv2.resize(frame, clip["size"])
+        if not write_slots_until(captured_at):
+            return False
+        clip["pending"] = frame
+        clip["pending_written"] = False
+        clip["last_captured"] = captured_at
+        clip["source_frames"] += 1
+        clip["detections"].extend(detection_records(detections, captured_at))
+        return True
+
     try:
-        while recording_active and (time.time() - recording_start_time) < RECORDING_DURATION:
-            if last_frame is not None:
-                with lock:
-                    frame = last_frame.copy()
-                
-                # Initialize writer on first frame
-                if video_writer is None:
-                    frame_size = (frame.shape[1], frame.shape[0])
-                    video_writer = cv2.VideoWriter(filepath, fourcc, fps, frame_size)
-                    
-                    if not video_writer.isOpened():
-                        # Fallback to mp4v if avc1 doesn't work
-                        add_log("RECORDING_WARNING", "avc1 codec failed, trying mp4v")
-                        fourcc_fallback = cv2.VideoWriter_fourcc(*'mp4v')
-                        video_writer = cv2.VideoWriter(filepath, fourcc_fallback, fps, frame_size)
-                        
-                        if not video_writer.isOpened():
-                            add_log("RECORDING_ERROR", "Failed to initialize video writer with both codecs")
-                            break
-                
-                # Add recording indicator to frame
-                elapsed = int(time.time() - recording_start_time)
-                remaining = RECORDING_DURATION - elapsed
-                cv2.putText(frame, f"REC {remaining}s", 
-                           (frame.shape[1] - 150, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                cv2.circle(frame, (frame.shape[1] - 180, 25), 8, (0, 0, 255), -1)
-                
-                # Write frame
-                video_writer.write(frame)
-            
-            time.sleep(0.05)  # ~20 FPS
-        
-        # Recording completed
-        duration = time.time() - recording_start_time
-        add_log("RECORDING_COMPLETE", f"Recording saved: {filename} ({int(duration)}s)")
+        # Flush the pre-event buffer first
+        for captured_at, jpeg, detections, labels, feed in preroll:
+            frame = annotate_frame(cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR),
+                                   detections, labels, feed)
+            if not add_frame(frame, captured_at, detections):
+                return
+
+        while recording_active and time.time() < recording_deadline:
+            try:
+                captured_at, frame, scene = frames_queue.get(timeout=0.25)
+            except queue.Empty:
+                continue
+            if clip["last_captured"] is not None and captured_at <= clip["last_captured"]:
+                continue  # Already covered by the pre-roll
+
+            # The published frame is shared with stream clients, so draw on a copy
+            frame = annotate_frame(*scene) if frame is None else frame.copy()
+
+            # Add recording indicator to frame
+            remaining = max(0, int(recording_deadline - captured_at))
+            cv2.putText(frame, f"REC {remaining}s", 
+                       (frame.shape[1] - 150, 30),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+            cv2.circle(frame, (frame.shape[1] - 180, 25), 8, (0, 0, 255), -1)
+
+            if not add_frame(frame, captured_at, scene[1]):
+                break
+
+        # Give the last frame its own slot(s), then report real vs nominal rate
+        if video_writer is not None and clip["pending"] is not None:
+            write_slots_until(clip["last_captured"] + 1.0 / fps)
+            span = max(clip["total_slots"] / fps, 1e-6)
+            last_recording_stats = {
+                "event_id": event_id,
+                "filename": segments[0],
+                "segments": list(segments),
+                "duration_seconds": round(span, 1),
+                "nominal_fps": fps,
+                "real_fps": round(clip["used_frames"] / span, 2),
+                "source_frames": clip["source_frames"],
+                "written_frames": clip["total_slots"],
+                "dropped_frames": clip["source_frames"] - clip["used_frames"],
+                "preroll_frames": len(preroll),
+                "encoder": "process" if isinstance(video_writer, EncoderProcessWriter) else "inline"
+            }
+            add_log("RECORDING_COMPLETE", f"Recording saved: {event_id} ({int(span)}s in {len(segments)} "
+                    f"segment(s), {last_recording_stats['real_fps']} fps real / {fps:g} fps nominal)")
         
     except Exception as e:
         add_log("RECORDING_ERROR", f"Error during recording: {str(e)}")
     
     finally:
         # Cleanup
-        if video_writer is not None:
-            video_writer.release()
+        unsubscribe_frames(frames_queue)
+        close_segment()
         recording_active = False
-        video_writer = None
 
 
 def stop_recording():
@@ -800,6 +1899,483 @@ def stop_recording():
             add_log("RECORDING_STOP", "Recording stopped manually")
 
 
+# ========= CONTINUOUS RECORDING (DVR) =========
+DVR_ENABLED = False  # start 24/7 recording together with the first pipeline
+DVR_DIR = os.path.join(RECORDINGS_DIR, "dvr")  # one subdirectory per camera
+DVR_INDEX_FILE = os.path.join(DVR_DIR, "index.json")
+DVR_SEGMENT_SECONDS = 60  # segments are cut on wall-clock multiples of this
+DVR_FPS = 10.0
+DVR_MAX_GAP_SECONDS = 2.0  # a longer pause in frames closes the segment instead of freezing it
+DVR_RETENTION_HOURS = 72  # 0 keeps segments regardless of age
+DVR_MAX_BYTES = 20 * 1024 ** 3  # disk quota for all DVR segments, 0 disables
+DVR_RETENTION_CHECK_SECONDS = 60
+
+dvr_lock = threading.Lock()
+dvr_stop_event = None  # set to stop the running recorder thread
+dvr_thread = None
+dvr_retention_thread = None
+dvr_index = {}  # camera -> segments sorted by start: {"filename", "start", "end", "frames", "bytes"}
+dvr_index_version = None  # (inode, mtime) of the index.json that dvr_index reflects
+dvr_stats = {"segments_written": 0, "segments_deleted": 0, "bytes_deleted": 0}
+
+
+def dvr_camera_dir(camera):
+    """Directory holding one camera's segments"""
+    return os.path.join(DVR_DIR, camera.replace(":", "_"))
+
+
+def index_file_version(stat):
+    # save_dvr_index replaces the file, so a new inode catches writes within one mtime tick
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def load_dvr_index():
+    """Load the segment index, dropping entries whose files are gone; call with dvr_lock held"""
+    global dvr_index, dvr_index_version
+    try:
+        with open(DVR_INDEX_FILE) as f:
+            dvr_index_version = index_file_version(os.fstat(f.fileno()))
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    dvr_index = {
+        camera: sorted((seg for seg in segments
+                        if os.path.exists(os.path.join(dvr_camera_dir(camera), seg["filename"]))),
+                       key=lambda seg: seg["start"])
+        for camera, segments in index.items()
+    }
+
+
+def refresh_dvr_index():
+    """Reload the index if another worker rewrote index.json since we last read or wrote it;
+    call with dvr_lock held"""
+    try:
+        version = index_file_version(os.stat(DVR_INDEX_FILE))
+    except OSError:
+        return
+    if version != dvr_index_version:
+        load_dvr_index()
+
+
+def save_dvr_index():
+    """Write the index atomically; call with dvr_lock held, after refresh_dvr_index"""
+    global dvr_index_version
+    tmp_path = DVR_INDEX_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(dvr_index, f)
+        f.flush()
+        dvr_index_version = index_file_version(os.fstat(f.fileno()))
+    os.replace(tmp_path, DVR_INDEX_FILE)
+
+
+def finish_dvr_segment(segment):
+    """Finalize a segment's file and add its time range to the index"""
+    writer = segment["writer"]
+    writer.release()
+    path = os.path.join(dvr_camera_dir(segment["camera"]), segment["filename"])
+    if not os.path.exists(path):
+        return
+    # No frames means no playable file; an encoder process reports what it actually wrote
+    if segment["slots"] == 0 or getattr(writer, "frames_written", segment["slots"]) == 0:
+        os.remove(path)
+        add_log("DVR_SEGMENT_EMPTY", f"Discarded {segment['filename']}: no frames written")
+        return
+    size = os.path.getsize(path)
+    metric_inc("recording_bytes_written_total", size)
+    entry = {
+        "filename": segment["filename"],
+        "start": round(segment["start"], 3),
+        "end": round(segment["start"] + segment["slots"] / DVR_FPS, 3),
+        "frames": segment["slots"],
+        "bytes": size
+    }
+    with dvr_lock:
+        refresh_dvr_index()
+        segments = dvr_index.setdefault(segment["camera"], [])
+        segments.append(entry)
+        segments.sort(key=lambda seg: seg["start"])
+        dvr_stats["segments_written"] += 1
+        save_dvr_index()
+
+
+def dvr_recorder(stop_event):
+    """Write raw published frames into fixed-length segments until `stop_event` is set"""
+    frames_queue = subscribe_frames()
+    segment = None
+
+    def fill_until(until):
+        # Same timeline as threat recordings: repeat the current frame per slot
+        target = int((until - segment["start"]) * DVR_FPS)
+        while segment["slots"] < target:
+            segment["writer"].write(segment["pending"])
+            segment["slots"] += 1
+
+    try:
+        while not stop_event.is_set():
+            try:
+                captured_at, _, scene = frames_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            frame = scene[0]
+            camera = camera_key(current_camera_url)
+            size = (frame.shape[1], frame.shape[0])
+
+            if segment is not None:
+                gap = captured_at - segment["last_captured"]
+                if captured_at >= segment["cut_at"]:
+                    fill_until(segment["cut_at"])
+                elif gap > DVR_MAX_GAP_SECONDS or camera != segment["camera"] or size != segment["size"]:
+                    fill_until(segment["last_captured"] + 1.0 / DVR_FPS)
+                else:
+                    fill_until(captured_at)
+                    segment["pending"] = frame
+                    segment["last_captured"] = captured_at
+                    continue
+                finish_dvr_segment(segment)
+                segment = None
+
+            os.makedirs(dvr_camera_dir(camera), exist_ok=True)
+            # Millisecond names: a segment reopened within the same second must not overwrite the last one
+            filename = f"dvr_{datetime.fromtimestamp(captured_at).strftime('%Y%m%d_%H%M%S_%f')[:-3]}.mp4"
+            writer = open_video_writer(os.path.join(dvr_camera_dir(camera), filename), DVR_FPS, size)
+            if writer is None:
+                add_log("DVR_ERROR", f"Could not open segment {filename}")
+                stop_event.wait(DVR_SEGMENT_SECONDS)
+                continue
+            segment = {
+                "camera": camera, "filename": filename, "writer": writer, "size": size,
+                "start": captured_at, "cut_at": captured_at - captured_at % DVR_SEGMENT_SECONDS + DVR_SEGMENT_SECONDS,
+                "slots": 0, "pending": frame, "last_captured": captured_at
+            }
+    except Exception as e:
+        add_log("DVR_ERROR", f"Continuous recording failed: {e}")
+    finally:
+        unsubscribe_frames(frames_queue)
+        if segment is not None:
+            fill_until(segment["last_captured"] + 1.0 / DVR_FPS)
+            finish_dvr_segment(segment)
+
+
+def apply_dvr_retention(now=None):
+    """Delete segments older than DVR_RETENTION_HOURS, then the oldest ones while over DVR_MAX_BYTES"""
+    now = now or time.time()
+    with dvr_lock:
+        refresh_dvr_index()
+        entries = sorted(((seg["start"], camera, seg) for camera, segments in dvr_index.items()
+                          for seg in segments), key=lambda entry: entry[0])
+        total = sum(seg["bytes"] for _, _, seg in entries)
+        expired = []
+        for _, camera, seg in entries:
+            too_old = DVR_RETENTION_HOURS > 0 and now - seg["end"] > DVR_RETENTION_HOURS * 3600
+            over_quota = DVR_MAX_BYTES > 0 and total > DVR_MAX_BYTES
+            if not (too_old or over_quota):
+                break
+            expired.append((camera, seg))
+            total -= seg["bytes"]
+        for camera, seg in expired:
+            dvr_index[camera].remove(seg)
+        if expired:
+            save_dvr_index()
+            dvr_stats["segments_deleted"] += len(expired)
+            dvr_stats["bytes_deleted"] += sum(seg["bytes"] for _, seg in expired)
+
+    # File deletion happens outside the lock
+    for camera, seg in expired:
+        try:
+            os.remove(os.path.join(dvr_camera_dir(camera), seg["filename"]))
+        except FileNotFoundError:
+            pass
+    if expired:
+        add_log("DVR_RETENTION", f"Deleted {len(expired)} old segment(s)")
+
+
+def dvr_retention_worker():
+    """Apply the retention policy every DVR_RETENTION_CHECK_SECONDS"""
+    while True:
+        try:
+            apply_dvr_retention()
+        except Exception as e:
+            add_log("DVR_ERROR", f"Retention check failed: {e}")
+        time.sleep(DVR_RETENTION_CHECK_SECONDS)
+
+
+def start_dvr():
+    """Start continuous recording and the retention worker; False if already running"""
+    global dvr_stop_event, dvr_thread, dvr_retention_thread
+    with dvr_lock:
+        if dvr_stop_event is not None and not dvr_stop_event.is_set():
+            return False
+        dvr_stop_event = threading.Event()
+        dvr_thread = threading.Thread(target=dvr_recorder, args=(dvr_stop_event,), daemon=True)
+        dvr_thread.start()
+        if dvr_retention_thread is None or not dvr_retention_thread.is_alive():
+            dvr_retention_thread = threading.Thread(target=dvr_retention_worker, daemon=True)
+            dvr_retention_thread.start()
+    add_log("DVR_START", f"Continuous recording started ({DVR_SEGMENT_SECONDS}s segments)")
+    return True
+
+
+def stop_dvr():
+    """Stop continuous recording; the open segment is finalized. False if not running"""
+    with dvr_lock:
+        if dvr_stop_event is None or dvr_stop_event.is_set():
+            return False
+        dvr_stop_event.set()
+    add_log("DVR_STOP", "Continuous recording stopped")
+    return True
+
+
+def dvr_segments(camera=None, start=None, end=None):
+    """Indexed segments overlapping [start, end], optionally for one camera, oldest first"""
+    with dvr_lock:
+        refresh_dvr_index()
+        cameras = [camera] if camera else list(dvr_index)
+        found = []
+        for cam in cameras:
+            segments = dvr_index.get(cam, [])
+            # Segments are at most DVR_SEGMENT_SECONDS long, so binary search on start
+            lo = 0 if start is None else bisect.bisect_left(segments, start - DVR_SEGMENT_SECONDS,
+                                                             key=lambda seg: seg["start"])
+            hi = len(segments) if end is None else bisect.bisect_right(segments, end, key=lambda seg: seg["start"])
+            found.extend(dict(seg, camera=cam) for seg in segments[lo:hi]
+                         if start is None or seg["end"] >= start)
+    return sorted(found, key=lambda seg: seg["start"])
+
+
+# ========= DVR CLIP EXPORT =========
+EXPORT_DIR = os.path.join(RECORDINGS_DIR, "exports")
+EXPORT_MAX_SECONDS = 2 * 3600  # longest range one export may cover
+EXPORT_CACHE_HOURS = 24  # finished exports are kept this long for repeat downloads
+EXPORT_TIMEOUT = 600  # seconds per ffmpeg run
+EXPORT_EXPIRY_CHECK_SECONDS = 600
+EXPORT_POLL_SECONDS = 30  # idle export workers look for queued jobs this often
+
+# Jobs are rows in the catalog's exports table, so every worker process can
+# report on and serve any export, whichever process accepted or ran it
+export_wakeup = threading.Event()
+export_threads_lock = threading.Lock()
+export_worker_thread = None
+export_expiry_thread = None
+
+
+def parse_time(value):
+    """Unix seconds from a number or an ISO 8601 string (naive means server local time)"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def segment_path(seg):
+    return os.path.abspath(os.path.join(dvr_camera_dir(seg["camera"]), seg["filename"]))
+
+
+def export_concat_list(segments, start, end):
+    """ffmpeg concat-demuxer script; only the first and last segment get in/out points"""
+    lines = ["ffconcat version 1.0"]
+    for seg in segments:
+        lines.append(f"file '{segment_path(seg)}'")
+        if start > seg["start"]:
+            lines.append(f"inpoint {start - seg['start']:.3f}")
+        if end < seg["end"]:
+            lines.append(f"outpoint {end - seg['start']:.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def export_reencode_args(segments, start, end):
+    """ffmpeg inputs and filter for segments that cannot be stream-copied together.
+
+    Each segment is its own trimmed input and the concat filter joins the
+    decoded frames, so segments written with different codecs (the recorder
+    falls back from avc1 to mp4v) still end up in one H.264 file.
+    """
+    args = []
+    for seg in segments:
+        if start > seg["start"]:
+            args += ["-ss", f"{start - seg['start']:.3f}"]
+        if end < seg["end"]:
+            args += ["-to", f"{end - seg['start']:.3f}"]
+        args += ["-i", segment_path(seg)]
+    streams = "".join(f"[{i}:v]" for i in range(len(segments)))
+    return args + ["-filter_complex", f"{streams}concat=n={len(segments)}:v=1:a=0[v]", "-map", "[v]",
+                   "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+                   "-threads", str(TRANSCODE_FFMPEG_THREADS)]
+
+
+def export_job(job_id):
+    """An export job as the API shows it, or None"""
+    with catalog_lock:
+        row = catalog_db.execute("SELECT * FROM exports WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["start"], job["end"] = job.pop("range_start"), job.pop("range_end")
+    job["reencode"] = None if job["reencode"] is None else bool(job["reencode"])
+    return job
+
+
+def update_export(job_id, **columns):
+    with catalog_lock, catalog_db:
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        catalog_db.execute(f"UPDATE exports SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+
+def run_export(job):
+    """Join the job's segments into one MP4, updating progress as ffmpeg reports it.
+
+    Segments sharing one codec are stream-copied; a range mixing codecs is re-encoded.
+    """
+    def update(**fields):
+        update_export(job["id"], **fields)
+
+    output = os.path.join(EXPORT_DIR, job["filename"])
+    if os.path.exists(output):
+        update(status="done", progress=1.0, finished_at=time.time(), size_bytes=os.path.getsize(output))
+        return
+    segments = dvr_segments(job["camera"], job["start"], job["end"])
+    if not segments:
+        update(status="failed", error="No recorded segments in this range")
+        return
+
+    # The concat demuxer reads every file with the first one's decoder, so mixed codecs need a re-encode
+    reencode = len({probe_codec(segment_path(seg)) for seg in segments}) > 1
+    update(status="running", segments=len(segments), reencode=reencode)
+    span = max(min(job["end"], segments[-1]["end"]) - max(job["start"], segments[0]["start"]), 1e-3)
+    list_path = output + ".txt"
+    tmp_path = output + ".part"
+    if reencode:
+        input_args = export_reencode_args(segments, job["start"], job["end"])
+    else:
+        with open(list_path, "w") as f:
+            f.write(export_concat_list(segments, job["start"], job["end"]))
+        input_args = ["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+    command = [FFMPEG_BIN, "-y", "-v", "error", *input_args,
+               "-movflags", "+faststart", "-progress", "pipe:1", "-f", "mp4", tmp_path]
+    try:
+        # stderr goes to a file: an undrained pipe would block ffmpeg once it fills
+        with tempfile.TemporaryFile("w+") as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True)
+            timer = threading.Timer(EXPORT_TIMEOUT, process.kill)
+            timer.start()
+            try:
+                for line in process.stdout:
+                    if line.startswith("out_time_us=") and line.strip() != "out_time_us=N/A":
+                        update(progress=round(min(int(line.split("=")[1]) / 1e6 / span, 0.99), 3))
+                returncode = process.wait()
+            finally:
+                timer.cancel()
+            if returncode != 0:
+                errors.seek(0)
+                raise RuntimeError(errors.read().strip()[-300:] or f"ffmpeg exited with {returncode}")
+        os.replace(tmp_path, output)
+        update(status="done", progress=1.0, finished_at=time.time(), size_bytes=os.path.getsize(output))
+        add_log("DVR_EXPORT_DONE", f"Exported {job['camera']} {span:.0f}s from {len(segments)} segment(s)"
+                f"{' (re-encoded, mixed codecs)' if reencode else ''}")
+    except Exception as e:
+        update(status="failed", error=str(e))
+        add_log("DVR_EXPORT_ERROR", f"Export {job['id']} failed: {e}")
+    finally:
+        for path in (list_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def claim_export_job():
+    """Move the oldest queued export to 'running' and return it, or None when nothing is queued"""
+    while True:
+        with catalog_lock:
+            row = catalog_db.execute("SELECT id FROM exports WHERE status = 'queued' "
+                                     "ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            with catalog_db:
+                # Conditional on the status, so only one process ever runs a job
+                claimed = catalog_db.execute("UPDATE exports SET status = 'running' "
+                                             "WHERE id = ? AND status = 'queued'", (row["id"],)).rowcount
+        if claimed:
+            return export_job(row["id"])
+
+
+def export_worker():
+    """Claim queued exports from the catalog and run them one at a time"""
+    while True:
+        job = claim_export_job()
+        if job is None:
+            export_wakeup.wait(EXPORT_POLL_SECONDS)
+            export_wakeup.clear()
+            continue
+        try:
+            run_export(job)
+        except Exception as e:
+            update_export(job["id"], status="failed", error=str(e))
+
+
+def ensure_export_worker():
+    """Start this process's export worker once"""
+    global export_worker_thread
+    with export_threads_lock:
+        if export_worker_thread is None or not export_worker_thread.is_alive():
+            export_worker_thread = threading.Thread(target=export_worker, daemon=True)
+            export_worker_thread.start()
+
+
+def request_export(camera, start, end):
+    """Get or create the export job for a camera and range; identical requests share one job and file"""
+    segments = dvr_segments(camera, start, end)
+    # The key covers the segment files too, so a range that gains footage gets a fresh export
+    key_source = json.dumps([camera, round(start, 3), round(end, 3),
+                             [(seg["filename"], seg["bytes"]) for seg in segments]])
+    job_id = hashlib.sha1(key_source.encode()).hexdigest()[:16]
+    filename = (f"export_{camera.replace(':', '_')}_"
+                f"{datetime.fromtimestamp(start).strftime('%Y%m%d_%H%M%S')}_{job_id}.mp4")
+    with catalog_lock, catalog_db:
+        # A new job is queued; an existing one is only queued again if it failed
+        catalog_db.execute(
+            "INSERT INTO exports (id, camera, range_start, range_end, filename, status, progress, segments, "
+            "created_at) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET status = 'queued', progress = 0, error = NULL, "
+            "created_at = excluded.created_at, finished_at = NULL WHERE exports.status = 'failed'",
+            (job_id, camera, start, end, filename, len(segments), time.time()))
+    ensure_export_worker()
+    export_wakeup.set()
+    return export_job(job_id)
+
+
+def expire_exports(now=None):
+    """Delete cached exports older than EXPORT_CACHE_HOURS"""
+    now = now or time.time()
+    for filename in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, filename)
+        try:
+            if filename.endswith(".mp4") and now - os.path.getmtime(path) > EXPORT_CACHE_HOURS * 3600:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # Another worker process expired it first
+    with catalog_lock, catalog_db:
+        catalog_db.execute("DELETE FROM exports WHERE finished_at < ?", (now - EXPORT_CACHE_HOURS * 3600,))
+
+
+def export_expiry_worker():
+    """Expire cached exports every EXPORT_EXPIRY_CHECK_SECONDS, whether or not DVR is recording"""
+    while True:
+        try:
+            expire_exports()
+        except Exception as e:
+            add_log("DVR_EXPORT_ERROR", f"Expiring exports failed: {e}")
+        time.sleep(EXPORT_EXPIRY_CHECK_SECONDS)
+
+
+def ensure_export_expiry():
+    """Start the export expiry thread once per process"""
+    global export_expiry_thread
+    with export_threads_lock:
+        if export_expiry_thread is None or not export_expiry_thread.is_alive():
+            export_expiry_thread = threading.Thread(target=export_expiry_worker, daemon=True)
+            export_expiry_thread.start()
+
+
 
 
 
@@ -807,44 +2383,130 @@ def stop_recording():
 
 
 #==== handle blackout =======
-def handle_blackout_failover():
-    """Triggered when camera feed is black for too long. Switches to next available camera."""
-    global stop_flag, current_feed, pipeline, current_camera_url
+def check_feed_signal(frame, now):
+    """Sample a small luma grid and return 'blackout', 'uniform' or 'frozen' once
+    that condition has lasted long enough to fail over; otherwise None."""
+    global last_signal_grid
+    signal_stats["frames"] += 1
+    if signal_stats["frames"] % BLACKOUT_CHECK_EVERY:
+        return None
+
+    start = time.perf_counter()
+    # Nearest-neighbour resize only reads the sampled pixels, so the cost does
+    # not grow with the camera resolution
+    grid = cv2.resize(frame, BLACKOUT_GRID_SIZE, interpolation=cv2.INTER_NEAREST)
+    luma = cv2.cvtColor(grid, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    brightness = luma.mean()
+    dark = brightness < BLACKOUT_BRIGHTNESS_THRESHOLD
+    conditions = {
+        "blackout": dark,
+        "uniform": not dark and luma.std() < UNIFORM_STDDEV_THRESHOLD,
+        "frozen": (FROZEN_SECONDS > 0 and last_signal_grid is not None
+                   and np.abs(luma - last_signal_grid).mean() < FROZEN_DIFF_THRESHOLD),
+    }
+    last_signal_grid = luma
+    signal_stats["checks"] += 1
+    signal_check_costs.append(time.perf_counter() - start)
+
+    failure = None
+    for name, active in conditions.items():
+        if not active:
+            signal_condition_since[name] = None
+            continue
+        if signal_condition_since[name] is None:
+            signal_condition_since[name] = now
+        limit = FROZEN_SECONDS if name == "frozen" else blackout_threshold
+        if failure is None and now - signal_condition_since[name] > limit:
+            failure = name
+
+    if failure:
+        # Start over so frames still queued from the old feed don't re-trigger
+        for name in signal_condition_since:
+            signal_condition_since[name] = None
+        last_signal_grid = None
+    return failure
+
+
+def signal_detector_summary():
+    """Cost and state of the blackout/frozen detector for /health/latency"""
+    costs = list(signal_check_costs)
+    checks, frames = signal_stats["checks"], signal_stats["frames"]
+    avg = sum(costs) / len(costs) if costs else 0.0
+    return {
+        "frames": frames,
+        "checks": checks,
+        "check_every": BLACKOUT_CHECK_EVERY,
+        "grid": list(BLACKOUT_GRID_SIZE),
+        "avg_check_us": round(avg * 1e6, 1),
+        "max_check_us": round(max(costs) * 1e6, 1) if costs else 0.0,
+        "per_frame_us": round(avg * 1e6 / BLACKOUT_CHECK_EVERY, 1),
+        "active_conditions": [name for name, since in signal_condition_since.items() if since is not None]
+    }
 
-    add_log("BLACKOUT_TRIGGER", f"Stopping {current_feed} feed due to blackout.")
-    stop_flag = True
-    time.sleep(1)
-    cleanup_pipeline()
 
-    # Get next available camera using current URL from global
-    new_url, new_label, new_name = get_next_available_camera(current_camera_url)
-    current_camera_url = new_url
-    add_log("BLACKOUT_SWITCH", f"Switching to {new_label.upper()} feed ({new_name}: {new_url}) due to blackout.")
+def handle_blackout_failover(reason="blackout"):
+    """Triggered when camera feed is black, uniform or frozen for too long. Switches to next available camera."""
+    failed_feed = current_feed
+    add_log("BLACKOUT_TRIGGER", f"Stopping {failed_feed} feed due to {reason}.")
+    metric_inc("failovers_total", cause=reason)
+
+    # Switch using current URL from global
+    new_url, new_label, new_name = fail_over(current_camera_url)
+    add_log("BLACKOUT_SWITCH", f"Switching to {new_label.upper()} feed ({new_name}: {new_url}) due to {reason}.")
     
     # Add voice alert for blackout failover
     add_alert(
         type="warning",
         title="Camera Failover - Blackout Detected",
-        description=f"Switching to {new_name} due to blackout on {current_feed} camera",
+        description=f"Switching to {new_name} due to {reason} on {failed_feed} camera",
         camera=new_name,
         speak_message="Adesh Attention !! Camera failover detected, switching to backup"
     )
 
-    stop_flag = False
-    threading.Thread(target=run_inference, args=(new_url, new_label), daemon=True).start()
-
 
 
 # ========= FAILOVER WATCHER =========
+def frame_watchdog(now):
+    """(frame age, stall limit, reference time) for the current pipeline.
+
+    Before the first frame the age counts from pipeline start with the startup
+    grace, which also spaces out the probes after a stall restart. A pipeline
+    that gave up while starting gets no grace, so the camera is probed at once.
+    """
+    started = pipeline_started_at or now
+    if last_frame_arrival is not None and last_frame_arrival >= started:
+        reference, limit = last_frame_arrival, FRAME_STALL_SECONDS
+    elif pipeline_failed_at is not None and pipeline_failed_at >= started:
+        reference, limit = started, FRAME_STALL_SECONDS
+    else:
+        reference, limit = started, PIPELINE_STARTUP_GRACE_SECONDS
+    return now - reference, limit, reference
+
+
+def liveness_summary():
+    """Watchdog settings and counters for /health/latency"""
+    age, limit, _ = frame_watchdog(time.time())
+    return dict(liveness_stats,
+                frame_age_seconds=round(age, 2),
+                stall_seconds=FRAME_STALL_SECONDS,
+                startup_grace_seconds=PIPELINE_STARTUP_GRACE_SECONDS,
+                stall_failover_probes=STALL_FAILOVER_PROBES,
+                current_limit_seconds=limit)
+
+
 def failover_watcher():
-    """Enhanced failover watcher with detailed TCP probe logging. Supports dynamic backup cameras."""
-    global stop_flag, current_feed, pipeline, current_camera_url, shutdown_flag
+    """Failover watcher driven by frame arrival times. Supports dynamic backup cameras.
 
-    last_tcp_ok = None
-    last_frame_ok = None
+    While the pipeline keeps delivering frames nothing touches the camera; only
+    when the newest frame is older than FRAME_STALL_SECONDS is the camera probed
+    (TCP, then a frame check). A failed probe triggers the failover; a live
+    camera gets its pipeline restarted, up to STALL_FAILOVER_PROBES times in a
+    row before the feed fails over anyway.
+    """
     last_feed_url = None
     last_status = None
     last_check_log_time = 0
+    stall_probes = 0  # consecutive probes that found the camera alive but no frames
 
     add_log("FAILOVER_WATCHER_START", "Failover watcher thread started")
 
@@ -853,95 +2515,112 @@ def failover_watcher():
         current_url = current_camera_url
         
         now = time.time()
+        if current_url != last_feed_url:
+            stall_probes = 0
         if current_url != last_feed_url or now - last_check_log_time > 60:
-            add_log("CHECKING_STREAM", f"Testing connection for {current_url}")
+            add_log("CHECKING_STREAM", f"Watching frame arrivals for {current_url}")
             last_check_log_time = now
 
-        # Step 1: TCP-level probe
-        tcp_ok, tcp_details = tcp_probe_attempts(current_url)
-
-        if tcp_ok != last_tcp_ok or current_url != last_feed_url:
-            if tcp_ok:
-                add_log("TCP_PROBE_OK", f"TCP reachable for {current_url}")
-            else:
-                # Log each attempt individually
-                for attempt in tcp_details:
-                    if attempt['ok']:
-                        result = "succeeded"
-                    else:
-                        result = f"failed: {attempt['error']}"
-                    add_log("TCP_PROBE_ATTEMPT",
-                            f"Attempt #{attempt['attempt']} to {attempt['host']}:{attempt['port']} {result}")
-
-                add_log("TCP_PROBE_FAIL", f"All TCP attempts failed for {current_url}")
-            last_tcp_ok = tcp_ok
-
-        # Step 2: Frame check (only if TCP OK)
-        frame_ok = is_stream_alive(current_url) if tcp_ok else False
-        if frame_ok != last_frame_ok or current_url != last_feed_url:
-            if frame_ok:
-                add_log("FRAME_CHECK_OK", f"Frame stream verified for {current_url}")
-            elif tcp_ok:
-                add_log("FRAME_CHECK_FAIL", f"TCP OK but no valid frames for {current_url}")
-            last_frame_ok = frame_ok
+        age, limit, stalled_since = frame_watchdog(now)
 
-        # === Case A: Feed healthy ===
-        if tcp_ok and frame_ok:
-            if last_status != "alive" or current_url != last_feed_url:
+        # === Case A: Frames are arriving ===
+        if age <= limit:
+            if last_status != "alive" and last_frame_arrival is not None and last_frame_arrival >= stalled_since:
                 add_log("STREAM_OK", f"Stream {current_url} is active and healthy")
                 last_status = "alive"
+                stall_probes = 0
+            last_feed_url = current_url
+            time.sleep(LIVENESS_CHECK_INTERVAL)
+            continue
 
-        # === Case B: Failure detected ===
-        elif not tcp_ok or not frame_ok:
-            if last_status != "failed" or current_url != last_feed_url:
-                add_log("STREAM_FAILED", f"Stream {current_url} failed (TCP: {tcp_ok}, Frames: {frame_ok})")
-                add_log("FEED_FAILED", f"{current_url} unreachable, initiating failover")
-                last_status = "failed"
-
-                stop_flag = True
-                time.sleep(1)
-                cleanup_pipeline()
-
-                # Get next available camera using dynamic backup cameras
-                new_url, new_label, new_name = get_next_available_camera(current_url)
-                current_camera_url = new_url
-                add_log("SWITCH_FEED", f"Switching to {new_label.upper()} feed ({new_name}: {new_url})")
-                
-                # Add voice alert for connection failure failover
-                add_alert(
-                    type="warning",
-                    title="Camera Failover - Connection Lost",
-                    description=f"Switching to {new_name} due to connection failure",
-                    camera=new_name,
-                    speak_message="Adesh Attention !! Camera failover detected, switching to backup"
-                )
-
-                stop_flag = False
-                threading.Thread(target=run_inference, args=(new_url, new_label), daemon=True).start()
+        # === Case B: Frames stopped, probe the camera ===
+        liveness_stats["stalls"] += 1
+        add_log("FRAME_STALL", f"No frames from {current_url} for {age:.1f}s, probing camera")
+        tcp_ok, tcp_details = tcp_probe_attempts(current_url, timeout=LIVENESS_TCP_TIMEOUT)
+        if tcp_ok:
+            add_log("TCP_PROBE_OK", f"TCP reachable for {current_url}")
+        else:
+            # Log each attempt individually
+            for attempt in tcp_details:
+                if attempt['ok']:
+                    result = "succeeded"
+                else:
+                    result = f"failed: {attempt['error']}"
+                add_log("TCP_PROBE_ATTEMPT",
+                        f"Attempt #{attempt['attempt']} to {attempt['host']}:{attempt['port']} {result}")
+
+            add_log("TCP_PROBE_FAIL", f"All TCP attempts failed for {current_url}")
+
+        frame_ok = is_stream_alive(current_url, timeout=LIVENESS_FRAME_TIMEOUT) if tcp_ok else False
+        liveness_stats["probes"] += 1
+
+        if frame_ok:
+            liveness_stats["probe_ok"] += 1
+            stall_probes += 1
+
+        if frame_ok and stall_probes < STALL_FAILOVER_PROBES:
+            # The camera answers, so the pipeline itself is stuck: restart it on the same camera
+            add_log("FRAME_CHECK_OK", f"Frame stream verified for {current_url}, pipeline stalled; "
+                    f"restarting it ({stall_probes}/{STALL_FAILOVER_PROBES})")
+            liveness_stats["restarts"] += 1
+            restart_pipeline(current_url, current_feed)
+            last_status = "restarting"
+        else:
+            if frame_ok:
+                add_log("FRAME_CHECK_OK", f"Frame stream verified for {current_url}, but the pipeline "
+                        f"stalled {stall_probes} times in a row")
+            elif tcp_ok:
+                add_log("FRAME_CHECK_FAIL", f"TCP OK but no valid frames for {current_url}")
+            detection = time.time() - stalled_since
+            record_latency("failure_detection", detection)
+            liveness_stats["failures"] += 1
+            liveness_stats["last_detection_seconds"] = round(detection, 2)
+            add_log("STREAM_FAILED", f"Stream {current_url} failed (TCP: {tcp_ok}, Frames: {frame_ok}), "
+                    f"detected {detection:.1f}s after the last frame")
+            add_log("FEED_FAILED", f"{current_url} {'keeps stalling' if frame_ok else 'unreachable'}, initiating failover")
+            metric_inc("failovers_total", cause="stall" if frame_ok else "tcp" if not tcp_ok else "frame_check")
+            last_status = "failed"
+
+            # Switch to the next camera using dynamic backup cameras
+            new_url, new_label, new_name = fail_over(current_url)
+            add_log("SWITCH_FEED", f"Switching to {new_label.upper()} feed ({new_name}: {new_url})")
+            
+            # Add voice alert for connection failure failover
+            add_alert(
+                type="warning",
+                title="Camera Failover - Connection Lost",
+                description=f"Switching to {new_name} due to connection failure",
+                camera=new_name,
+                speak_message="Adesh Attention !! Camera failover detected, switching to backup"
+            )
 
-                # Reset state trackers
-                last_tcp_ok = None
-                last_frame_ok = None
-                last_feed_url = new_url
-                last_status = "recovering"
-                last_check_log_time = 0
+            # Reset state trackers
+            current_url = new_url
+            stall_probes = 0
+            last_status = "recovering"
+            last_check_log_time = 0
 
         last_feed_url = current_url
-        time.sleep(5)
+        time.sleep(LIVENESS_CHECK_INTERVAL)
 
 
 # ========= CLEANUP FUNCTION =========
+def stop_pipeline(inference_pipeline):
+    """Terminate a pipeline through whichever shutdown method it has"""
+    if hasattr(inference_pipeline, "terminate"):
+        inference_pipeline.terminate()
+    elif hasattr(inference_pipeline, "close"):
+        inference_pipeline.close()
+    elif hasattr(inference_pipeline, "stop"):
+        inference_pipeline.stop()
+
+
 def cleanup_pipeline():
     global pipeline
     add_log("CLEANUP_START", "Cleaning up old pipeline")
     try:
         if pipeline:
-            if hasattr(pipeline, "terminate"):
-                pipeline.terminate()
-            elif hasattr(pipeline, "close"):
-                pipeline.close()
-            elif hasattr(pipeline, "stop"):
-                pipeline.stop()
+            stop_pipeline(pipeline)
         pipeline = None
         add_log("CLEANUP_DONE", "Cleanup complete")
     except Exception as e:
@@ -950,6 +2629,431 @@ def cleanup_pipeline():
     time.sleep(1)
 
 
+# ========= FAILOVER TARGET SELECTION =========
+# At failover time every other camera is probed in parallel (TCP round trips,
+# then a frame check) and the feed moves to the healthiest one that answers,
+# instead of the next camera in list order.
+HEALTH_SCORED_FAILOVER = True
+FAILOVER_PROBE_DEADLINE = 3.0  # seconds for all candidate probes together
+FAILOVER_PROBE_ATTEMPTS = 3  # TCP connects per candidate
+FAILOVER_PROBE_TCP_TIMEOUT = 0.5
+FAILOVER_FRAME_TIMEOUT = 1.5  # frame check per candidate, cut short by the deadline
+CAMERA_FAILURE_WINDOW = 600  # failovers away from a camera within this window lower its score
+CAMERA_FAILURE_PENALTY = 20  # score points per recent failure
+
+camera_failures_lock = threading.Lock()
+camera_failures = defaultdict(deque)  # camera key -> times the feed failed over away from it
+last_target_selection = None  # candidates and scores from the most recent failover
+
+
+def record_camera_failure(url, now=None):
+    """Remember that the feed failed over away from `url`"""
+    with camera_failures_lock:
+        camera_failures[camera_key(url)].append(now or time.time())
+
+
+def recent_camera_failures(key, now):
+    with camera_failures_lock:
+        failures = camera_failures.get(key)
+        if not failures:
+            return 0
+        while failures and now - failures[0] > CAMERA_FAILURE_WINDOW:
+            failures.popleft()
+        return len(failures)
+
+
+def score_candidate(latency, jitter, loss, frame_ok, failures):
+    """0-100, higher is healthier; None when the camera cannot take over"""
+    if latency is None or not frame_ok:
+        return None
+    score = 100 - min(latency, 500) / 10 - min(jitter, 200) / 10 - loss - CAMERA_FAILURE_PENALTY * failures
+    return round(max(score, 0.0), 1)
+
+
+def describe_candidate(candidate):
+    """One candidate's probe result for the FAILOVER_TARGET log line"""
+    if candidate["timed_out"]:
+        return f"{candidate['camera']}=down (probe timed out)"
+    if candidate["latency_ms"] is None:
+        return f"{candidate['camera']}=down (no TCP)"
+    if not candidate["frame_ok"]:
+        return f"{candidate['camera']}=down (no frames, {candidate['latency_ms']}ms)"
+    return (f"{candidate['camera']}={candidate['score']} ({candidate['latency_ms']}ms, "
+            f"jitter {candidate['jitter_ms']}ms, loss {candidate['loss_pct']}%, "
+            f"{candidate['recent_failures']} recent failures)")
+
+
+def select_failover_target(from_url):
+    """Probe every other camera concurrently and return the healthiest as (url, label, name).
+
+    Candidates that do not finish within FAILOVER_PROBE_DEADLINE count as down.
+    Equal scores go to the camera the chain would pick; when nothing answers,
+    the chain's choice is used unprobed.
+    """
+    global last_target_selection
+    chain_url, chain_label, chain_name = get_next_available_camera(from_url)
+    candidates = [c for c in get_all_camera_urls() if c["url"] != from_url]
+    if not candidates:
+        return chain_url, chain_label, chain_name
+
+    started = time.time()
+    deadline = started + FAILOVER_PROBE_DEADLINE
+    results = {}
+
+    def probe(camera):
+        latency, jitter, loss = sample_tcp_metrics(camera["url"], attempts=FAILOVER_PROBE_ATTEMPTS,
+                                                   timeout=FAILOVER_PROBE_TCP_TIMEOUT)
+        remaining = deadline - time.time()
+        frame_ok = latency is not None and remaining > 0 and is_stream_alive(
+            camera["url"], timeout=min(FAILOVER_FRAME_TIMEOUT, remaining))
+        results[camera["url"]] = (latency, jitter, loss, frame_ok)
+
+    probes = [threading.Thread(target=probe, args=(camera,), daemon=True) for camera in candidates]
+    for thread in probes:
+        thread.start()
+    for thread in probes:
+        thread.join(max(0.0, deadline - time.time()))
+
+    now = time.time()
+    scored = []
+    for camera in candidates:
+        result = results.get(camera["url"])
+        latency, jitter, loss, frame_ok = result or (None, None, None, False)
+        failures = recent_camera_failures(camera_key(camera["url"]), now)
+        scored.append({
+            "url": camera["url"], "label": camera["label"], "camera": camera["name"],
+            "url_key": camera_key(camera["url"]),
+            "latency_ms": latency, "jitter_ms": jitter,
+            "loss_pct": round(loss, 1) if loss is not None else None,
+            "frame_ok": frame_ok, "timed_out": result is None, "recent_failures": failures,
+            "score": score_candidate(latency, jitter, loss, frame_ok, failures)
+        })
+
+    reachable = [c for c in scored if c["score"] is not None]
+    chosen = min(reachable, key=lambda c: (-c["score"], c["url"] != chain_url), default=None)
+    elapsed = round(now - started, 3)
+    summary = "; ".join(describe_candidate(c) for c in scored)
+    if chosen:
+        target = chosen["url"], chosen["label"], chosen["camera"]
+        add_log("FAILOVER_TARGET", f"Chose {chosen['camera']} (score {chosen['score']}) after {elapsed}s: {summary}")
+    else:
+        target = chain_url, chain_label, chain_name
+        add_log("FAILOVER_TARGET_NONE", f"No camera answered within {elapsed}s, "
+                f"falling back to {chain_name}: {summary}")
+
+    last_target_selection = {
+        "at": started, "from": camera_key(from_url), "chosen": camera_key(target[0]), "seconds": elapsed,
+        "candidates": [{k: v for k, v in c.items() if k != "url"} for c in scored]
+    }
+    return target
+
+
+# ========= HOT STANDBY =========
+# The next camera in the failover chain is kept connected, so a failover skips
+# the reachability check, the stream negotiation and the cleanup pauses.
+# "capture" keeps a VideoCapture open on the standby; a switch shows its newest
+# frame and releases the capture before the new pipeline connects, since
+# ESP32 streams accept one client at a time.
+# "pipeline" also runs the model on the standby (twice the inference load) and
+# a switch only swaps which pipeline is active.
+HOT_STANDBY_ENABLED = False
+HOT_STANDBY_MODE = "capture"  # "capture" or "pipeline"
+STANDBY_CHECK_INTERVAL = 2.0  # how often the standby is re-aimed at the next camera in the chain
+STANDBY_RECONNECT_SECONDS = 5.0  # wait before reopening a standby capture that failed
+STANDBY_MAX_FRAME_AGE = 2.0  # a standby whose newest frame is older than this counts as cold
+STANDBY_RELEASE_TIMEOUT = 3.0  # wait for the standby capture to disconnect before the pipeline connects
+FAILOVER_HISTORY = 20  # completed failovers kept for /health/latency
+
+standby_lock = threading.Lock()
+standby = None  # url, label, name, mode, stop event, newest frame and its time, standby pipeline
+standby_thread = None
+standby_stop_event = threading.Event()
+standby_stats = {"started": 0, "promoted": 0, "cold_switches": 0, "capture_errors": 0, "slow_releases": 0}
+
+# Time from the failover decision to the new camera's first frame on the stream
+failover_lock = threading.Lock()
+pending_failover = None
+failover_history = deque(maxlen=FAILOVER_HISTORY)
+
+
+def standby_capture(state):
+    """Keep a capture open on the standby camera and hold on to its newest frame"""
+    while not state["stop"].is_set():
+        cap = cv2.VideoCapture(state["url"])
+        delivered = False
+        while not state["stop"].is_set() and cap.isOpened():
+            ok, frame = cap.read()
+            if not ok:
+                break
+            state["frame"], state["frame_at"] = frame, time.time()
+            state["fresh"].set()
+            delivered = True
+        cap.release()
+        if not state["stop"].is_set():
+            standby_stats["capture_errors"] += 1
+            if delivered:  # Only log the drop, not every retry against a dead camera
+                add_log("STANDBY_RECONNECT", f"Standby capture on {state['name']} dropped, retrying")
+            state["stop"].wait(STANDBY_RECONNECT_SECONDS)
+
+
+def standby_pipeline(state):
+    """Run a full pipeline on the standby camera; its frames are dropped until it is promoted"""
+    try:
+        standby_pipe = create_pipeline(state["url"], feed_callback(state["url"], state))
+        state["pipeline"] = standby_pipe
+        if state["stop"].is_set():
+            stop_pipeline(standby_pipe)
+            return
+        standby_pipe.start()
+    except Exception as e:
+        standby_stats["capture_errors"] += 1
+        add_log("STANDBY_ERROR", f"Standby pipeline on {state['name']} failed: {str(e)}")
+
+
+def start_standby(url, label, name):
+    """Connect to `url` in the background and return its standby state"""
+    state = {
+        "url": url, "label": label, "name": name, "mode": HOT_STANDBY_MODE,
+        "stop": threading.Event(), "fresh": threading.Event(),
+        "frame": None, "frame_at": None, "pipeline": None, "started_at": time.time()
+    }
+    target = standby_pipeline if HOT_STANDBY_MODE == "pipeline" else standby_capture
+    state["thread"] = threading.Thread(target=target, args=(state,), daemon=True)
+    state["thread"].start()
+    standby_stats["started"] += 1
+    add_log("STANDBY_START", f"Keeping {name} warm ({HOT_STANDBY_MODE}): {url}")
+    return state
+
+
+def stop_standby(state, reason):
+    """Disconnect a standby that was not promoted"""
+    state["stop"].set()
+    if state["pipeline"] is not None:
+        threading.Thread(target=stop_pipeline, args=(state["pipeline"],), daemon=True).start()
+    add_log("STANDBY_STOP", f"Released standby on {state['name']} ({reason})")
+
+
+def standby_is_warm(state, now):
+    return state["frame_at"] is not None and now - state["frame_at"] <= STANDBY_MAX_FRAME_AGE
+
+
+def release_standby(reason):
+    """Disconnect the current standby, if any"""
+    global standby
+    with standby_lock:
+        if standby is not None:
+            stop_standby(standby, reason)
+            standby = None
+
+
+def standby_manager():
+    """Keep the standby aimed at the camera the chain would fail over to next"""
+    global standby
+    while not standby_stop_event.is_set():
+        target = None
+        if HOT_STANDBY_ENABLED and current_camera_url:
+            target = get_next_available_camera(current_camera_url)
+            if target[0] == current_camera_url:
+                target = None  # No other camera to keep warm
+        with standby_lock:
+            if standby is not None and (target is None or standby["url"] != target[0]
+                                        or standby["mode"] != HOT_STANDBY_MODE):
+                stop_standby(standby, "failover chain changed")
+                standby = None
+            if standby is None and target is not None:
+                standby = start_standby(*target)
+        standby_stop_event.wait(STANDBY_CHECK_INTERVAL)
+    release_standby("stream stopped")
+
+
+def ensure_standby_manager():
+    """Start the standby manager thread once per stream session"""
+    global standby_thread
+    with standby_lock:
+        standby_stop_event.clear()
+        if standby_thread is None or not standby_thread.is_alive():
+            standby_thread = threading.Thread(target=standby_manager, daemon=True)
+            standby_thread.start()
+
+
+def stop_standby_manager():
+    """Stop keeping a standby warm (stream stopped)"""
+    standby_stop_event.set()
+    release_standby("stream stopped")
+
+
+def take_standby(from_url):
+    """Detach the standby if it is warm and is where the chain goes next from `from_url`"""
+    global standby
+    next_url = get_next_available_camera(from_url)[0]
+    with standby_lock:
+        state = standby
+        if state is None or state["url"] != next_url:
+            return None
+        standby = None
+        if standby_is_warm(state, time.time()):
+            return state
+        # Cold standby: let the new pipeline have the camera to itself
+        stop_standby(state, "no recent frames")
+        return None
+
+
+def hand_over_standby_capture(state):
+    """Show the warm capture's newest frame, release the capture, then start the pipeline on its camera"""
+    frame = state["frame"]
+    if frame is not None:
+        placeholder = {"predictions": [], "image": {"width": frame.shape[1], "height": frame.shape[0]},
+                       "standby_handoff": True}
+        enqueue_frame((frame, placeholder, time.time(), state["frame_at"]))
+    # The capture loop checks the stop event after every read, then releases the camera
+    state["stop"].set()
+    state["thread"].join(STANDBY_RELEASE_TIMEOUT)
+    if state["thread"].is_alive():
+        standby_stats["slow_releases"] += 1
+        add_log("STANDBY_RELEASE_SLOW", f"Standby capture on {state['name']} still open after "
+                f"{STANDBY_RELEASE_TIMEOUT}s, starting the pipeline anyway")
+    if stop_flag or current_camera_url != state["url"]:
+        return  # Stopped or switched again meanwhile
+    run_inference(state["url"], state["label"], verified=True)
+
+
+def own_promoted_pipeline(promoted, label):
+    """Owner thread of a promoted standby pipeline, as run_inference is for the pipelines it starts"""
+    # Another switch replaces the global pipeline; a stop or restart raises stop_flag
+    while not stop_flag and pipeline is promoted:
+        time.sleep(1)
+    try:
+        stop_pipeline(promoted)
+        add_log("PIPELINE_STOPPED", f"{label} pipeline stopped")
+    except Exception as e:
+        add_log("PIPELINE_STOP_ERROR", f"Error stopping {label} pipeline: {str(e)}")
+
+
+def begin_failover_timing(from_url, to_url, name, mode, started_at, switched_at):
+    """Start timing a failover; frames received before `switched_at` belong to the old camera"""
+    global pending_failover
+    with failover_lock:
+        pending_failover = {
+            "from": camera_key(from_url), "to": camera_key(to_url), "camera": name, "mode": mode,
+            "at": started_at, "switched_at": switched_at,
+            "switch_seconds": round(switched_at - started_at, 3),
+            "first_frame_seconds": None, "first_annotated_seconds": None
+        }
+
+
+def note_failover_frame(received_at, inferred):
+    """Frame worker hook: completes the pending failover timing"""
+    global pending_failover
+    if pending_failover is None:
+        return
+    with failover_lock:
+        timing = pending_failover
+        if timing is None or received_at < timing["switched_at"]:
+            return
+        elapsed = round(time.time() - timing["at"], 3)
+        if timing["first_frame_seconds"] is None:
+            timing["first_frame_seconds"] = elapsed
+        if not inferred:
+            return
+        timing["first_annotated_seconds"] = elapsed
+        failover_history.append(timing)
+        pending_failover = None
+    record_latency("failover_first_frame", elapsed)
+    add_log("FAILOVER_READY", f"First annotated frame from {timing['camera']} {elapsed:.2f}s "
+            f"after the failover ({timing['mode']})")
+
+
+def fail_over(from_url):
+    """Move the feed from `from_url` to the next camera in the chain; returns (url, label, name).
+
+    Uses the warm standby when it has recent frames, otherwise stops the
+    pipeline and starts a new one on the healthiest camera (HEALTH_SCORED_FAILOVER)
+    or the next camera in the chain.
+    """
+    global stop_flag, pipeline, current_camera_url, current_feed, pipeline_started_at
+    started_at = time.time()
+    pipeline_started_at = started_at  # The switch counts as startup for the watchdog
+    record_camera_failure(from_url, started_at)
+    state = take_standby(from_url) if HOT_STANDBY_ENABLED else None
+
+    if state is None:
+        standby_stats["cold_switches"] += 1
+        if HEALTH_SCORED_FAILOVER:
+            # Probe the candidates while the old pipeline shuts down
+            selected = []
+            selector = threading.Thread(target=lambda: selected.append(select_failover_target(from_url)),
+                                        daemon=True)
+            selector.start()
+        stop_flag = True
+        time.sleep(1)
+        cleanup_pipeline()
+        if HEALTH_SCORED_FAILOVER:
+            selector.join()
+            new_url, new_label, new_name = selected[0] if selected else get_next_available_camera(from_url)
+        else:
+            new_url, new_label, new_name = get_next_available_camera(from_url)
+        current_camera_url = new_url
+        begin_failover_timing(from_url, new_url, new_name, "cold", started_at, time.time())
+        stop_flag = False
+        threading.Thread(target=run_inference, args=(new_url, new_label), daemon=True).start()
+        return new_url, new_label, new_name
+
+    standby_stats["promoted"] += 1
+    old_pipeline = pipeline
+    if state["mode"] == "pipeline":
+        # The standby pipeline is already producing predictions: swap it in
+        pipeline = state["pipeline"]
+        current_feed = state["label"]
+        current_camera_url = state["url"]
+        threading.Thread(target=own_promoted_pipeline, args=(pipeline, state["label"]), daemon=True).start()
+    else:
+        pipeline = None
+        current_camera_url = state["url"]
+        threading.Thread(target=hand_over_standby_capture, args=(state,), daemon=True).start()
+    begin_failover_timing(from_url, state["url"], state["name"], state["mode"], started_at, time.time())
+    if old_pipeline is not None:
+        threading.Thread(target=stop_pipeline, args=(old_pipeline,), daemon=True).start()
+    add_log("STANDBY_PROMOTED", f"Switched to warm {state['name']} in {time.time() - started_at:.3f}s")
+    return state["url"], state["label"], state["name"]
+
+
+def restart_pipeline(url, label):
+    """Replace a stalled pipeline with a fresh one on the same camera"""
+    global stop_flag, pipeline_started_at, current_camera_url
+    pipeline_started_at = time.time()  # The new pipeline gets the startup grace
+    stop_flag = True
+    time.sleep(1)
+    cleanup_pipeline()
+    current_camera_url = url
+    stop_flag = False
+    # The liveness probe just read a frame from this camera, so skip the reachability check
+    threading.Thread(target=run_inference, args=(url, label, True), daemon=True).start()
+
+
+def failover_summary():
+    """Hot-standby state and recent failover timings for /health/latency"""
+    with standby_lock:
+        state = standby
+    now = time.time()
+    with failover_lock:
+        recent = list(failover_history)
+        pending = dict(pending_failover) if pending_failover else None
+    return {
+        "hot_standby": HOT_STANDBY_ENABLED,
+        "mode": HOT_STANDBY_MODE,
+        "standby": {
+            "camera": state["name"],
+            "url_key": camera_key(state["url"]),
+            "warm": standby_is_warm(state, now),
+            "frame_age_seconds": round(now - state["frame_at"], 2) if state["frame_at"] else None
+        } if state else None,
+        "stats": dict(standby_stats),
+        "pending": pending,
+        "recent": recent,
+        "last_selection": last_target_selection
+    }
+
+
 # ========= STREAM CHECK =========
 def is_stream_reachable(url, timeout=5.0):
     """Check if video stream URL is accessible"""
@@ -975,28 +3079,149 @@ def is_stream_reachable(url, timeout=5.0):
         add_log("STREAM_CHECK_ERROR", f"Error checking stream: {str(e)}")
         return False
 
+# ========= MOTION GATE =========
+MOTION_GATE_ENABLED = True
+MOTION_GATE_WIDTH = 160  # motion is measured on a frame downscaled to this width
+MOTION_PIXEL_THRESHOLD = 25  # luma difference for a pixel to count as changed
+MOTION_AREA_THRESHOLD = 0.01  # fraction of changed pixels that counts as motion
+MOTION_BACKGROUND_ALPHA = 0.05  # background model update rate
+MOTION_FORCE_INFERENCE_SECONDS = 2.0  # always run the model at least this often
+
+motion_gate_lock = threading.Lock()
+motion_gate_stats = {}  # camera -> {"inferred": n, "skipped": n}
+
+# One model shared by every pipeline (active and standby), loaded on first use
+inference_model = None
+inference_model_lock = threading.Lock()
+
+
+class MotionGate:
+    """Sits in front of the pipeline's frame-processing callable and skips
+    inference on frames without motion.
+
+    It is the `on_video_frame` handler given to
+    InferencePipeline.init_with_custom_logic, which calls it on the inference
+    thread with a list of frames (one frame in releases before multi-source
+    support) and expects a prediction per frame. Frames that have not changed
+    meaningfully against a running-average background are not passed on; they
+    get the last real predictions instead.
+    """
+
+    def __init__(self, process_frames, camera):
+        self._process_frames = process_frames
+        self._camera = camera
+        self._background = None
+        self._last_predictions = None
+        self._last_inference_at = 0.0
+        with motion_gate_lock:
+            motion_gate_stats.setdefault(camera, {"inferred": 0, "skipped": 0})
+
+    def _has_motion(self, image):
+        height = max(1, int(image.shape[0] * MOTION_GATE_WIDTH / image.shape[1]))
+        small = cv2.resize(image, (MOTION_GATE_WIDTH, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            return True
+        changed = (cv2.absdiff(gray, self._background) > MOTION_PIXEL_THRESHOLD).mean()
+        cv2.accumulateWeighted(gray, self._background, MOTION_BACKGROUND_ALPHA)
+        return changed >= MOTION_AREA_THRESHOLD
+
+    def _needs_inference(self, image):
+        motion = self._has_motion(image)
+        due = time.time() - self._last_inference_at >= MOTION_FORCE_INFERENCE_SECONDS
+        return self._last_predictions is None or motion or due
+
+    def __call__(self, video_frames):
+        batch = isinstance(video_frames, list)
+        if not batch:
+            video_frames = [video_frames]
+        needed = [self._needs_inference(frame.image) for frame in video_frames]
+        due = [frame for frame, need in zip(video_frames, needed) if need]
+        if not due:
+            results = iter(())
+        elif batch:
+            results = iter(self._process_frames(due))
+        else:
+            results = iter([self._process_frames(due[0])])
+        with motion_gate_lock:
+            motion_gate_stats[self._camera]["inferred"] += len(due)
+            motion_gate_stats[self._camera]["skipped"] += len(video_frames) - len(due)
+
+        # A skipped frame reuses the newest predictions that precede it
+        output = []
+        for need in needed:
+            if need:
+                self._last_predictions = next(results)
+                self._last_inference_at = time.time()
+            output.append(self._last_predictions)
+        return output if batch else output[0]
+
+
+def create_pipeline(url, on_prediction_handler):
+    """InferencePipeline on `url` running the shared model, behind a MotionGate when enabled"""
+    global inference_model
+    with inference_model_lock:
+        if inference_model is None:
+            inference_model = get_model(model_id=MODEL_ID, api_key=ROBOFLOW_API_KEY)
+    process_frames = partial(default_process_frame, model=inference_model, inference_config=ModelConfig.init())
+    if MOTION_GATE_ENABLED:
+        process_frames = MotionGate(process_frames, camera_key(url))
+        add_log("MOTION_GATE_ON", f"Motion gate enabled for {camera_key(url)}")
+    return InferencePipeline.init_with_custom_logic(
+        video_reference=url,
+        on_video_frame=process_frames,
+        on_prediction=on_prediction_handler
+    )
+
+
 # ========= PIPELINE RUNNER =========
-def run_inference(url, label):
-    global pipeline, current_feed, stop_flag, current_camera_url
+def feed_callback(url, standby_state=None):
+    """on_prediction for the pipeline on `url`; frames only pass while it is the active camera.
+
+    A pipeline that is being torn down after a switch therefore cannot leak
+    stale frames onto the stream, and a standby pipeline stays silent (it only
+    marks itself warm) until it is promoted.
+    """
+    def callback(predictions, video_frame):
+        if current_camera_url == url:
+            on_prediction(predictions, video_frame)
+        elif standby_state is not None:
+            standby_state["frame_at"] = time.time()
+    return callback
+
+
+def mark_pipeline_failed(started_at):
+    """End the startup grace of the pipeline started at `started_at`; it will not deliver frames"""
+    global pipeline_failed_at
+    if pipeline_started_at == started_at:  # A newer pipeline has its own grace
+        pipeline_failed_at = time.time()
+
+
+def run_inference(url, label, verified=False):
+    global pipeline, current_feed, stop_flag, current_camera_url, pipeline_started_at
     current_feed = label
     current_camera_url = url  # Update global current URL
+    started_at = time.time()
+    pipeline_started_at = started_at  # Frame-age watchdog measures from here until the first frame
     
     add_log("PIPELINE_START", f"Starting {label} feed: {url}")
+    ensure_frame_worker()
+    if DVR_ENABLED:
+        start_dvr()
+    if HOT_STANDBY_ENABLED:
+        ensure_standby_manager()
     
-    # Check if stream is reachable before initializing pipeline
-    if not is_stream_reachable(url, timeout=5.0):
+    # Check if stream is reachable before initializing pipeline (a warm standby already proved it)
+    if not verified and not is_stream_reachable(url, timeout=5.0):
         add_log("PIPELINE_SKIP", f"Skipping {label} feed - stream not reachable: {url}")
+        mark_pipeline_failed(started_at)
         return
     
     local_pipeline = None
     try:
         add_log("PIPELINE_INIT_START", f"Initializing {label} pipeline...")
-        local_pipeline = InferencePipeline.init(
-            api_key=ROBOFLOW_API_KEY,
-            model_id=MODEL_ID,
-            video_reference=url,
-            on_prediction=on_prediction
-        )
+        local_pipeline = create_pipeline(url, feed_callback(url))
         pipeline = local_pipeline  # Update global pipeline
         add_log("PIPELINE_INIT_OK", f"{label} pipeline initialized successfully")
         
@@ -1004,13 +3229,15 @@ def run_inference(url, label):
         local_pipeline.start()
         add_log("PIPELINE_RUNNING", f"{label} pipeline is now running")
          
-        while not stop_flag:
+        # A hot-standby switch replaces the global pipeline without raising stop_flag
+        while not stop_flag and pipeline is local_pipeline:
             time.sleep(1)
             
     except Exception as e:
         add_log("PIPELINE_ERROR", f"{label} feed error: {str(e)}")
         import traceback
         add_log("PIPELINE_ERROR_TRACE", f"Traceback: {traceback.format_exc()}")
+        mark_pipeline_failed(started_at)
     finally:
         if local_pipeline:
             try:
@@ -1024,21 +3251,213 @@ def run_inference(url, label):
 
 
 # ========= MJPEG STREAM =========
-def generate_frames():
+JPEG_QUALITY = 95  # cv2.imencode default; lower it (or pass ?quality=) to trade quality for bandwidth
+STREAM_WAIT_TIMEOUT = 1.0  # seconds a client waits for a new frame before re-checking
+STREAM_KEEPALIVE_SECONDS = 10  # resend the last frame after this long without a new one (0 disables)
+LEGACY_RESEND_INTERVAL = 0.05  # old fixed resend period, used to count the duplicate sends we now skip
+
+# Versioned JPEG buffers, one per (width, quality) variant, shared by every
+# /ai_feed client asking for that variant. Evicted when the last client leaves.
+stream_variants = {}
+stream_variants_lock = threading.Lock()
+
+# Bounds for the /ai_feed ?width=&quality=&fps= query parameters
+STREAM_MIN_WIDTH = 160
+STREAM_MIN_QUALITY = 10
+STREAM_MAX_QUALITY = 95
+STREAM_MIN_FPS = 0.5
+STREAM_MAX_FPS = 30
+
+# Delivery counters for /stream/status
+stream_stats_lock = threading.Lock()
+stream_stats = {
+    "clients": 0,
+    "frames_sent": 0,
+    "keepalives_sent": 0,
+    "duplicate_sends_avoided": 0
+}
+
+
+def publish_frame(frame, scene, captured_at):
+    """Publish a new frame and wake up every waiting stream client.
+
+    `frame` is the annotated image, or None when annotation was skipped; `scene`
+    holds what is needed to draw it on demand.
+    """
+    global last_frame, last_scene, last_timing, frame_seq
+    with timed_lock(frame_cond, "frame"):
+        last_frame = frame
+        last_scene = scene
+        last_timing = {"captured_at": captured_at, "published_at": time.time()}
+        frame_seq += 1
+        frame_cond.notify_all()
+
+    with frame_subscribers_lock:
+        subscribers = list(frame_subscribers)
+    for q in subscribers:
+        # Slow subscribers lose their oldest frames rather than blocking the worker
+        while True:
+            try:
+                q.put_nowait((captured_at, frame, scene))
+                break
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+def subscribe_frames(maxsize=FRAME_SUBSCRIBER_QUEUE_SIZE):
+    """Get a queue that receives (captured_at, frame, scene) for every published frame"""
+    q = queue.Queue(maxsize=maxsize)
+    with frame_subscribers_lock:
+        frame_subscribers.append(q)
+    return q
+
+
+def unsubscribe_frames(q):
+    with frame_subscribers_lock:
+        if q in frame_subscribers:
+            frame_subscribers.remove(q)
+
+
+def get_annotated_frame():
+    """Return (seq, annotated frame, timing) for the latest frame, drawing it now if annotation was skipped"""
     global last_frame
-    while True:
-        if last_frame is not None:
+    with annotate_lock:
+        with timed_lock(lock, "frame"):
+            seq, frame, scene, timing = frame_seq, last_frame, last_scene, last_timing
+        if frame is None and scene is not None:
+            frame = annotate_frame(*scene)
+            annotation_stats["on_demand"] += 1
             with lock:
-                _, buffer = cv2.imencode('.jpg', last_frame)
-                frame = buffer.tobytes()
+                if frame_seq == seq:
+                    last_frame = frame
+    return seq, frame, timing
+
+
+def acquire_stream_variant(width=None, quality=JPEG_QUALITY):
+    """Register a client for a variant, creating its buffer if needed. Returns the variant key."""
+    key = (width, quality)
+    with stream_variants_lock:
+        variant = stream_variants.get(key)
+        if variant is None:
+            variant = {"lock": threading.Lock(), "seq": 0, "jpeg": None, "timing": None, "clients": 0, "encodes": 0}
+            stream_variants[key] = variant
+        variant["clients"] += 1
+    return key
+
+
+def release_stream_variant(key):
+    """Unregister a client; drop the variant buffer once nobody is watching it"""
+    with stream_variants_lock:
+        variant = stream_variants.get(key)
+        if variant is None:
+            return
+        variant["clients"] -= 1
+        if variant["clients"] <= 0:
+            del stream_variants[key]
+
+
+def get_encoded_frame(key):
+    """Return (seq, jpeg_bytes, timing) of the latest frame for a variant, encoding each frame once per variant"""
+    with stream_variants_lock:
+        variant = stream_variants.get(key)
+    if variant is None:
+        return 0, None, None
+    width, quality = key
+
+    with variant["lock"]:
+        # Resize/encode outside the frame lock so on_prediction is never
+        # blocked by a JPEG encode
+        seq, frame, timing = get_annotated_frame()
+        if seq != variant["seq"] and frame is not None:
+            if width and width < frame.shape[1]:
+                height = int(frame.shape[0] * width / frame.shape[1])
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                variant["seq"] = seq
+                variant["jpeg"] = buffer.tobytes()
+                variant["timing"] = timing
+                variant["encodes"] += 1
+                metric_inc("frames_encoded_total")
+        return variant["seq"], variant["jpeg"], variant["timing"]
+
+
+def _count_stream_send(gap, keepalive=False):
+    """Update delivery counters; `gap` is the time since this client's previous send"""
+    # The old loop sent a frame every LEGACY_RESEND_INTERVAL whether it changed or not
+    avoided = max(0, int(gap / LEGACY_RESEND_INTERVAL) - 1)
+    with stream_stats_lock:
+        stream_stats["keepalives_sent" if keepalive else "frames_sent"] += 1
+        stream_stats["duplicate_sends_avoided"] += avoided
+
+
+def generate_frames(width=None, quality=JPEG_QUALITY, fps=None, keepalive=STREAM_KEEPALIVE_SECONDS):
+    """Yield MJPEG parts only when a new frame is published, plus optional keep-alives"""
+    key = acquire_stream_variant(width, quality)
+    min_interval = 1.0 / fps if fps else 0
+    seen_seq = 0
+    sent_seq = 0
+    jpeg = None
+    last_sent_at = time.time()
+
+    with stream_stats_lock:
+        stream_stats["clients"] += 1
+    try:
+        while True:
+            # Rate-limited clients sleep first and then take whatever is newest,
+            # so frames they skip are never encoded on their behalf
+            wait = min_interval - (time.time() - last_sent_at)
+            if wait > 0 and sent_seq:
+                time.sleep(wait)
+
+            with frame_cond:
+                changed = frame_cond.wait_for(lambda: frame_seq != seen_seq, timeout=STREAM_WAIT_TIMEOUT)
+                seen_seq = frame_seq
+
+            is_keepalive = False
+            if changed:
+                seq, new_jpeg, timing = get_encoded_frame(key)
+                if new_jpeg is None or seq == sent_seq:
+                    continue
+                sent_seq, jpeg = seq, new_jpeg
+                record_first_byte(seq, timing)
+            elif keepalive and jpeg is not None and time.time() - last_sent_at >= keepalive:
+                is_keepalive = True
+            else:
+                continue
+
+            now = time.time()
+            _count_stream_send(now - last_sent_at, keepalive=is_keepalive)
+            last_sent_at = now
             yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.05)
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+    finally:
+        # Client disconnected: account for the idle tail since the last send
+        idle_avoided = int((time.time() - last_sent_at) / LEGACY_RESEND_INTERVAL)
+        with stream_stats_lock:
+            stream_stats["clients"] -= 1
+            stream_stats["duplicate_sends_avoided"] += idle_avoided
+        release_stream_variant(key)
 
 
 @app.route('/ai_feed')
 def ai_feed():
-    return Response(generate_frames(),
+    """MJPEG feed. Optional ?width=640&quality=60&fps=5 for low-bandwidth viewers."""
+    width = request.args.get('width', type=int)
+    quality = request.args.get('quality', JPEG_QUALITY, type=int)
+    fps = request.args.get('fps', type=float)
+
+    # Clamp to sane ranges; width is only ever used to downscale
+    if width is not None:
+        width = max(STREAM_MIN_WIDTH, width)
+    quality = min(STREAM_MAX_QUALITY, max(STREAM_MIN_QUALITY, quality))
+    if fps is not None:
+        fps = min(STREAM_MAX_FPS, max(STREAM_MIN_FPS, fps))
+
+    return Response(generate_frames(width, quality, fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
@@ -1758,31 +4177,124 @@ def get_camera_battery(camera_type):
 def health_view():
     return jsonify(health), 200
 
+
+@app.route("/metrics")
+def metrics_view():
+    """Prometheus text-format metrics"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/health/cameras")
+def camera_health_view():
+    """Rolling latency/jitter/loss history for every configured camera"""
+    try:
+        samples = int(request.args.get("history", CAMERA_HEALTH_DEFAULT_SAMPLES))
+    except ValueError:
+        return jsonify({"success": False, "error": "history must be an integer"}), 400
+    samples = max(0, min(samples, CAMERA_HEALTH_HISTORY))
+    active = camera_key(current_camera_url) if current_camera_url else None
+    with camera_health_lock:
+        cameras = [
+            {
+                "camera": key,
+                "name": entry["name"],
+                "label": entry["label"],
+                "id": entry["id"],
+                "active": key == active,
+                "status": entry["history"][-1]["status"],
+                "last": entry["history"][-1],
+                "summary": summarize_camera_health(entry["history"]),
+                "history": list(entry["history"])[-samples:] if samples else []
+            }
+            for key, entry in camera_health.items()
+        ]
+    return jsonify({
+        "running": camera_health_thread is not None and camera_health_thread.is_alive(),
+        "interval_seconds": CAMERA_HEALTH_INTERVAL,
+        "history_size": CAMERA_HEALTH_HISTORY,
+        "cameras": cameras
+    }), 200
+
+
+@app.route("/health/latency")
+def latency_view():
+    """Per-stage frame path latency: capture -> inference -> worker -> annotation -> publish -> first byte"""
+    return jsonify({
+        "fps": health["fps"],
+        "window": LATENCY_WINDOW,
+        "stages": latency_summary(),
+        "blackout_detector": signal_detector_summary(),
+        "liveness": liveness_summary(),
+        "failover": failover_summary()
+    }), 200
+
 # recording endpoint 
 
 
 @app.route('/recordings')
 def list_recordings():
-    """List all recorded videos"""
+    """List recorded videos from the catalog; segments of one session share an event_id.
+
+    Query params: limit, offset, sort (created|size|duration|filename|camera),
+    order (asc|desc), camera, event_id, threat, since, until (unix seconds), min_duration,
+    q (substring of the displayed title, file name or camera).
+    """
+    sort = request.args.get("sort", "created")
+    order = request.args.get("order", "desc")
+    if sort not in CATALOG_SORT_COLUMNS or order not in ("asc", "desc"):
+        return jsonify({"error": f"sort must be one of {sorted(CATALOG_SORT_COLUMNS)}, order asc or desc"}), 400
+    limit = min(max(request.args.get("limit", RECORDINGS_PAGE_SIZE, type=int), 1), RECORDINGS_MAX_PAGE_SIZE)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    filters = {
+        "camera": request.args.get("camera"),
+        "event_id": request.args.get("event_id"),
+        "threat": request.args.get("threat"),
+        "since": request.args.get("since", type=float),
+        "until": request.args.get("until", type=float),
+        "min_duration": request.args.get("min_duration", type=float),
+        "q": request.args.get("q", "").strip()
+    }
     try:
-        files = []
-        for filename in os.listdir(RECORDINGS_DIR):
-            if filename.endswith(('.avi', '.mp4')):
-                filepath = os.path.join(RECORDINGS_DIR, filename)
-                size_mb = os.path.getsize(filepath) / (1024 * 1024)
-                files.append({
-                    "filename": filename,
-                    "size_mb": round(size_mb, 2),
-                    "created": datetime.fromtimestamp(
-                        os.path.getctime(filepath)
-                    ).strftime("%Y-%m-%d %H:%M:%S")
-                })
-        
-        files.sort(key=lambda x: x['created'], reverse=True)
-        return jsonify({"recordings": files, "total": len(files)})
+        rows, total = query_catalog(filters, sort, order, limit, offset)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    files = []
+    events = {}
+    for row in rows:
+        size_mb = row["size_bytes"] / (1024 * 1024)
+        files.append({
+            "filename": row["filename"],
+            "title": row["title"],
+            "size_mb": round(size_mb, 2),
+            "created": datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "event_id": row["event_id"],
+            "part": row["part"],
+            "duration_seconds": row["duration_seconds"],
+            "frame_count": row["frame_count"],
+            "camera": row["camera"],
+            "threats": json.loads(row["threats"] or "[]"),
+            "detection_count": row["detection_count"],
+            "poster": f"/recordings/{row['filename']}/poster" if row["preview_ready"] == 1 else None,
+            "sprite": f"/recordings/{row['filename']}/sprite" if row["preview_ready"] == 1 else None,
+            "sprite_frames": PREVIEW_SPRITE_FRAMES if row["preview_ready"] == 1 else 0,
+            "codec": row["codec"],
+            "transcode_status": row["transcode_status"]
+        })
+        event = events.setdefault(row["event_id"], {"event_id": row["event_id"], "segments": [], "size_mb": 0.0})
+        event["segments"].append(row["filename"])
+        event["size_mb"] = round(event["size_mb"] + size_mb, 2)
+    for event in events.values():
+        event["segments"].sort()
+
+    return jsonify({
+        "recordings": files,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "events": list(events.values())
+    })
+
 
 @app.route('/recordings/<filename>', methods=['GET', 'OPTIONS'])
 def serve_recording(filename):
@@ -1793,7 +4305,7 @@ def serve_recording(filename):
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Range, Content-Type'
-        response.headers['Access-Control-Expose-Headers'] = 'Content-Range, Accept-Ranges, Content-Length'
+        response.headers['Access-Control-Expose-Headers'] = 'Content-Range, Accept-Ranges, Content-Length, ETag, Last-Modified'
         return response
     
     try:
@@ -1806,9 +4318,6 @@ def serve_recording(filename):
         if not os.path.exists(filepath):
             return jsonify({"error": "File not found"}), 404
         
-        # Get file size
-        file_size = os.path.getsize(filepath)
-        
         # Determine MIME type
         if filename.endswith('.mp4'):
             mimetype = 'video/mp4'
@@ -1817,69 +4326,96 @@ def serve_recording(filename):
         else:
             mimetype = 'application/octet-stream'
         
-        # Handle Range requests for video seeking
-        range_header = request.headers.get('Range', None)
-        if range_header:
-            # Parse range header
-            byte_start = 0
-            byte_end = file_size - 1
-            
-            range_match = range_header.replace('bytes=', '').split('-')
-            if range_match[0]:
-                byte_start = int(range_match[0])
-            if len(range_match) > 1 and range_match[1]:
-                byte_end = int(range_match[1])
-            
-            # Read the requested byte range
-            with open(filepath, 'rb') as f:
-                f.seek(byte_start)
-                data = f.read(byte_end - byte_start + 1)
-            
-            # Create response with 206 Partial Content
-            response = Response(
-                data,
-                206,  # Partial Content
-                mimetype=mimetype,
-                headers={
-                    'Content-Range': f'bytes {byte_start}-{byte_end}/{file_size}',
-                    'Accept-Ranges': 'bytes',
-                    'Content-Length': str(len(data)),
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Range',
-                }
-            )
-            return response
-        else:
-            # Serve entire file
-            return send_from_directory(
-                RECORDINGS_DIR, 
-                filename, 
-                as_attachment=False,
-                mimetype=mimetype
-            )
+        # Werkzeug streams the file (sendfile where the server supports it), so
+        # memory per viewer stays constant. conditional=True handles Range
+        # (including suffix ranges and 416 for unsatisfiable ones), ETag,
+        # Last-Modified, If-None-Match/If-Modified-Since (304) and If-Range.
+        return send_from_directory(
+            os.path.abspath(RECORDINGS_DIR),
+            filename,
+            as_attachment=False,
+            mimetype=mimetype,
+            conditional=True,
+            etag=True
+        )
+    except HTTPException:
+        raise  # 416 and friends keep their status
     except Exception as e:
         print(f"Error serving recording: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/recordings/search')
+def search_recordings():
+    """Clips whose detection sidecars match ?class=&min_confidence=&since=&until=&camera=, newest first"""
+    min_confidence = request.args.get("min_confidence", type=float)
+    if min_confidence is not None and min_confidence > 1:
+        min_confidence /= 100  # accept percentages too
+    limit = min(max(request.args.get("limit", RECORDINGS_PAGE_SIZE, type=int), 1), RECORDINGS_MAX_PAGE_SIZE)
+    try:
+        clips = search_detections(request.args.get("class"), min_confidence,
+                                  request.args.get("since", type=float), request.args.get("until", type=float),
+                                  request.args.get("camera"), limit)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"clips": clips, "total": len(clips)})
+
+
+@app.route('/recordings/<filename>/detections')
+def serve_recording_detections(filename):
+    """Per-frame detection sidecar of a recording"""
+    if not filename.endswith(('.avi', '.mp4')):
+        return jsonify({"error": "Invalid file type"}), 400
+    path = sidecar_path(filename)
+    if not os.path.exists(path):
+        return jsonify({"error": "No detections recorded for this file"}), 404
+    return send_from_directory(os.path.abspath(RECORDINGS_DIR), os.path.basename(path),
+                               mimetype='application/json')
+
+
+@app.route('/recordings/<filename>/<kind>')
+def serve_recording_preview(filename, kind):
+    """Serve a recording's poster or sprite strip with long-lived cache headers"""
+    if kind not in ("poster", "sprite") or not filename.endswith(('.avi', '.mp4')):
+        return jsonify({"error": "Invalid preview"}), 400
+    path = preview_paths(filename)[0 if kind == "poster" else 1]
+    if not os.path.exists(path):
+        return jsonify({"error": "Preview not generated yet"}), 404
+    response = send_from_directory(os.path.abspath(RECORDINGS_DIR), os.path.basename(path),
+                                   mimetype='image/jpeg', max_age=PREVIEW_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/recording/status')
 def recording_status():
     """Get current recording status"""
     if recording_active and recording_start_time:
         elapsed = int(time.time() - recording_start_time)
-        remaining = max(0, RECORDING_DURATION - elapsed)
+        remaining = max(0, int(recording_deadline - time.time()))
         return jsonify({
             "recording": True,
             "elapsed_seconds": elapsed,
             "remaining_seconds": remaining,
-            "total_duration": RECORDING_DURATION
+            "total_duration": int(recording_deadline - recording_start_time),
+            "max_duration": RECORDING_MAX_DURATION,
+            "segment_seconds": RECORDING_SEGMENT_SECONDS,
+            "preroll_seconds": PREROLL_SECONDS,
+            "preroll_buffers": preroll_summary(),
+            "last_recording": last_recording_stats
         })
     else:
         return jsonify({
             "recording": False,
             "elapsed_seconds": 0,
             "remaining_seconds": 0,
-            "total_duration": RECORDING_DURATION
+            "total_duration": RECORDING_DURATION,
+            "max_duration": RECORDING_MAX_DURATION,
+            "segment_seconds": RECORDING_SEGMENT_SECONDS,
+            "preroll_seconds": PREROLL_SECONDS,
+            "preroll_buffers": preroll_summary(),
+            "last_recording": last_recording_stats
         })
 
 
@@ -1903,6 +4439,117 @@ def manual_stop_recording():
     return jsonify({"success": True, "message": "Recording stopped"})
 
 
+@app.route('/dvr/status')
+def dvr_status():
+    """Continuous recording state, retention settings and per-camera storage"""
+    with dvr_lock:
+        refresh_dvr_index()
+        active = dvr_stop_event is not None and not dvr_stop_event.is_set()
+        cameras = {
+            camera: {
+                "segments": len(segments),
+                "bytes": sum(seg["bytes"] for seg in segments),
+                "oldest": segments[0]["start"] if segments else None,
+                "newest": segments[-1]["end"] if segments else None
+            }
+            for camera, segments in dvr_index.items()
+        }
+        stats = dict(dvr_stats)
+    return jsonify({
+        "active": active,
+        "segment_seconds": DVR_SEGMENT_SECONDS,
+        "fps": DVR_FPS,
+        "retention_hours": DVR_RETENTION_HOURS,
+        "max_bytes": DVR_MAX_BYTES,
+        "total_bytes": sum(cam["bytes"] for cam in cameras.values()),
+        "cameras": cameras,
+        "stats": stats
+    })
+
+
+@app.route('/dvr/start', methods=['POST'])
+def dvr_start():
+    """Start continuous recording"""
+    if not start_dvr():
+        return jsonify({"success": False, "message": "Continuous recording already running"}), 400
+    return jsonify({"success": True, "message": "Continuous recording started"})
+
+
+@app.route('/dvr/stop', methods=['POST'])
+def dvr_stop():
+    """Stop continuous recording"""
+    if not stop_dvr():
+        return jsonify({"success": False, "message": "Continuous recording not running"}), 400
+    return jsonify({"success": True, "message": "Continuous recording stopped"})
+
+
+@app.route('/dvr/segments')
+def list_dvr_segments():
+    """Segments overlapping ?start=&end= (unix seconds), optionally for ?camera=host:port"""
+    start = request.args.get("start", type=float)
+    end = request.args.get("end", type=float)
+    segments = dvr_segments(request.args.get("camera"), start, end)
+    return jsonify({"segments": segments, "total": len(segments)})
+
+
+@app.route('/dvr/segments/<camera>/<filename>')
+def serve_dvr_segment(camera, filename):
+    """Serve one DVR segment file"""
+    if not filename.endswith('.mp4'):
+        return jsonify({"error": "Invalid file type"}), 400
+    with dvr_lock:
+        refresh_dvr_index()
+        known_camera = camera in dvr_index
+    if not known_camera:
+        return jsonify({"error": "Unknown camera"}), 404
+    directory = os.path.abspath(dvr_camera_dir(camera))
+    if not os.path.exists(os.path.join(directory, filename)):
+        return jsonify({"error": "File not found"}), 404
+    return send_from_directory(directory, filename, mimetype='video/mp4')
+
+
+@app.route('/dvr/export', methods=['POST'])
+def dvr_export():
+    """Start (or reuse) an export of a camera between start and end (unix seconds or ISO 8601)"""
+    data = request.get_json(silent=True) or {}
+    camera = data.get("camera")
+    try:
+        start = parse_time(data.get("start"))
+        end = parse_time(data.get("end"))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "start and end must be unix seconds or ISO 8601"}), 400
+    if not camera or start is None or end is None:
+        return jsonify({"success": False, "error": "camera, start and end are required"}), 400
+    if end <= start or end - start > EXPORT_MAX_SECONDS:
+        return jsonify({"success": False, "error": f"Range must be positive and at most {EXPORT_MAX_SECONDS}s"}), 400
+    if FFMPEG_BIN is None:
+        return jsonify({"success": False, "error": "ffmpeg is not installed on the server"}), 503
+    if not dvr_segments(camera, start, end):
+        return jsonify({"success": False, "error": "No recorded segments in this range"}), 404
+    job = request_export(camera, start, end)
+    return jsonify({"success": True, "job": job}), 202
+
+
+@app.route('/dvr/export/<job_id>')
+def dvr_export_status(job_id):
+    """Progress of an export job"""
+    job = export_job(job_id)
+    if job is None:
+        return jsonify({"error": "Export job not found"}), 404
+    return jsonify(dict(job, download=f"/dvr/export/{job_id}/download" if job["status"] == "done" else None))
+
+
+@app.route('/dvr/export/<job_id>/download')
+def dvr_export_download(job_id):
+    """Download a finished export"""
+    job = export_job(job_id)
+    filename = job["filename"] if job and job["status"] == "done" else None
+    if filename is None or not os.path.exists(os.path.join(EXPORT_DIR, filename)):
+        return jsonify({"error": "Export not ready"}), 404
+    return send_from_directory(os.path.abspath(EXPORT_DIR), filename, mimetype='video/mp4',
+                               as_attachment=True, conditional=True)
+
+
 # ========= STREAM CONTROL ENDPOINTS =========
 @app.route('/stream/start', methods=['POST'])
 def start_stream_threads():
@@ -1935,6 +4582,8 @@ def start_stream_threads():
             
             # Start health sampler
             threading.Thread(target=health_sampler, daemon=True).start()
+            if CAMERA_HEALTH_ENABLED:
+                ensure_camera_health_prober()
             
             stream_threads_started = True
             add_log("STREAM_STARTED", "All inference threads started successfully")
@@ -1956,10 +4605,31 @@ def start_stream_threads():
 def get_stream_status():
     """Get status of stream threads"""
     global stream_threads_started
+    with stream_stats_lock:
+        delivery = dict(stream_stats)
+    delivery["frame_seq"] = frame_seq
+    delivery["annotations"] = dict(annotation_stats)
+    with frame_queue_lock:
+        frame_queue_info = dict(frame_queue_stats)
+    frame_queue_info.update({
+        "depth": frame_queue.qsize(),
+        "capacity": FRAME_QUEUE_SIZE,
+        "drop_policy": FRAME_QUEUE_DROP_POLICY
+    })
+    with stream_variants_lock:
+        delivery["variants"] = [
+            {"width": w, "quality": q, "clients": v["clients"], "encodes": v["encodes"]}
+            for (w, q), v in stream_variants.items()
+        ]
+    with motion_gate_lock:
+        motion_gate = {camera: dict(counts) for camera, counts in motion_gate_stats.items()}
     return jsonify({
         "threads_started": stream_threads_started,
         "active_feed": current_feed,
-        "current_url": current_camera_url
+        "current_url": current_camera_url,
+        "delivery": delivery,
+        "frame_queue": frame_queue_info,
+        "motion_gate": motion_gate
     })
 
 
@@ -1988,6 +4658,8 @@ def stop_stream_threads():
             
             # Clean up pipeline
             cleanup_pipeline()
+            stop_standby_manager()
+            camera_health_stop.set()
             
             # Wait a bit more for threads to finish
             time.sleep(1)
@@ -2022,9 +4694,52 @@ def stop_stream_threads():
             }), 500
 
 
+# ========= STARTUP =========
+def make_storage_dirs():
+    for directory in (RECORDINGS_DIR, DVR_DIR, EXPORT_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+
+def startup_rescan():
+    """Reconcile the catalog with the disk once per server start, before any process serves.
+
+    Called by `python main.py` and by gunicorn's when_ready hook in the master,
+    so the rescan never runs once per worker and can safely reset jobs that
+    the previous run left half done. Uses a connection of its own.
+    """
+    global catalog_db
+    make_storage_dirs()
+    catalog_db = open_catalog()
+    try:
+        rescan_catalog()
+    finally:
+        catalog_db.close()
+        catalog_db = None  # gunicorn forks workers from this process; each opens its own
+
+
+def init_app():
+    """Per-process setup: storage directories, the catalog connection, the DVR index,
+    the preview/transcode/export workers that drain pending catalog rows and export expiry.
+
+    Nothing here runs at import time, so importing main (gunicorn's master,
+    tooling) never touches the recordings directory.
+    """
+    global catalog_db
+    make_storage_dirs()
+    catalog_db = open_catalog()
+    with dvr_lock:
+        load_dvr_index()
+    ensure_preview_worker()
+    ensure_transcode_workers()
+    ensure_export_worker()
+    ensure_export_expiry()
+
+
 # ========= MAIN =========
 if __name__ == '__main__':
-    
+    startup_rescan()
+    init_app()
+
     # Initialize backup cameras (load from file or create initial entry)
     try:
         backup_cameras_list = get_backup_cameras()
@@ -0,0 +1,198 @@
+"""Out-of-process video encoding for recordings.
+
+The recorder copies each frame into a ring of fixed-size shared-memory slots
+and writes the slot index to the encoder's stdin. The encoder process owns the
+cv2.VideoWriter, writes the slots in the order they were queued and hands them
+back over stdout. Encoding therefore never competes with the inference
+callback or the MJPEG encoders for the main process's GIL.
+
+The encoder is this file run as a script (`python video_encoder.py ...`), not
+a multiprocessing child, so it never re-imports the application's main module;
+it only needs cv2 and numpy. When the parent goes away the encoder sees EOF on
+stdin and finalizes the file.
+"""
+import atexit
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+OPEN_TIMEOUT = 20.0  # seconds to wait for the encoder process to open the file
+WRITE_TIMEOUT = 1.0  # seconds to wait for a free slot before dropping a frame
+CLOSE_TIMEOUT = 30.0  # seconds to wait for the encoder to finalize the file
+
+_open_writers = weakref.WeakSet()
+_open_writers_lock = threading.Lock()
+
+
+def _attach_shared_memory(name):
+    """Attach to the parent's segment without letting this process's resource tracker unlink it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _send(message):
+    try:
+        print(message, flush=True)
+    except (BrokenPipeError, ValueError):
+        pass  # Parent is gone; keep finalizing the file
+
+
+def _encoder_main(filepath, fps, frame_size, shm_name, slot_count):
+    """Encoder process: write queued slots until stdin is closed"""
+    # Ctrl+C reaches the whole process group; the parent decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shm = _attach_shared_memory(shm_name)
+    width, height = frame_size
+    slots = np.ndarray((slot_count, height, width, 3), dtype=np.uint8, buffer=shm.buf)
+
+    writer = None
+    codec = None
+    # Try 'avc1' (H.264) first for browser playback, fall back to 'mp4v'
+    for candidate in ("avc1", "mp4v"):
+        writer = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*candidate), fps, frame_size)
+        if writer.isOpened():
+            codec = candidate
+            break
+        writer = None
+    _send(f"opened {codec or '-'}")
+
+    written = 0
+    try:
+        while writer is not None:
+            line = sys.stdin.readline()
+            if not line:
+                break  # Parent released the writer or exited
+            slot = int(line)
+            writer.write(slots[slot])
+            written += 1
+            _send(f"free {slot}")
+    finally:
+        # Releasing the writer writes the MP4 index, so the clip stays playable
+        if writer is not None:
+            writer.release()
+        del slots
+        shm.close()
+        _send(f"closed {written}")
+
+
+class EncoderProcessWriter:
+    """cv2.VideoWriter-like handle whose encoding runs in a separate process"""
+
+    def __init__(self, filepath, fps, frame_size, slot_count=4):
+        width, height = frame_size
+        self.filepath = filepath
+        self.codec = None
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self._closed = False
+        self._shm = shared_memory.SharedMemory(create=True, size=slot_count * width * height * 3)
+        self._slots = np.ndarray((slot_count, height, width, 3), dtype=np.uint8, buffer=self._shm.buf)
+        self._free_slots = queue.Queue()
+        self._events = queue.Queue()
+        for slot in range(slot_count):
+            self._free_slots.put(slot)
+
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), filepath, str(fps), str(width), str(height),
+             self._shm.name, str(slot_count)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        threading.Thread(target=self._read_events, daemon=True).start()
+        with _open_writers_lock:
+            _open_writers.add(self)
+
+        try:
+            kind, value = self._events.get(timeout=OPEN_TIMEOUT)
+        except queue.Empty:
+            kind, value = None, None
+        self.codec = value if kind == "opened" and value != "-" else None
+        if self.codec is None:
+            self.release()
+
+    def _read_events(self):
+        """Route the encoder's stdout: freed slots to the slot queue, the rest to events"""
+        for line in self._process.stdout:
+            kind, _, value = line.strip().partition(" ")
+            if kind == "free":
+                self._free_slots.put(int(value))
+            elif kind in ("opened", "closed"):
+                self._events.put((kind, value))
+        self._events.put(("exited", None))
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def isOpened(self):
+        return not self._closed and self.codec is not None and self._process.poll() is None
+
+    def write(self, frame):
+        """Copy `frame` into a free slot and queue it; frames are written in call order"""
+        if self._process.poll() is not None:
+            raise RuntimeError(f"encoder process exited with code {self._process.returncode}")
+        try:
+            slot = self._free_slots.get(timeout=WRITE_TIMEOUT)
+        except queue.Empty:
+            self.frames_dropped += 1
+            return
+        self._slots[slot] = frame
+        try:
+            self._process.stdin.write(f"{slot}\n")
+            self._process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            raise RuntimeError("encoder process closed its input")
+
+    def release(self):
+        """Finish queued frames, finalize the file and free the shared memory"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._process.stdin.close()  # EOF tells the encoder to finalize
+        except (BrokenPipeError, OSError):
+            pass
+        while True:
+            try:
+                kind, value = self._events.get(timeout=CLOSE_TIMEOUT)
+            except queue.Empty:
+                break
+            if kind == "closed":
+                self.frames_written = int(value)
+            if kind in ("closed", "exited"):
+                break
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        with _open_writers_lock:
+            _open_writers.discard(self)
+        del self._slots
+        self._shm.close()
+        self._shm.unlink()
+
+
+@atexit.register
+def _release_open_writers():
+    # Lets encoders finalize their files before the interpreter exits
+    with _open_writers_lock:
+        writers = list(_open_writers)
+    for writer in writers:
+        writer.release()
+
+
+if __name__ == "__main__":
+    path, fps, width, height, name, count = sys.argv[1:7]
+    _encoder_main(path, float(fps), (int(width), int(height)), name, int(count))
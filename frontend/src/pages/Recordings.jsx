@@ -2,39 +2,62 @@ import { useState, useEffect } from 'react'
 import GlitchText from '../components/GlitchText'
 
 const BACKEND_URL = 'http://127.0.0.1:8000'
+const PAGE_SIZE = 24
 
 function Recordings() {
   const [recordings, setRecordings] = useState([])
+  const [totalRecordings, setTotalRecordings] = useState(0)
   const [searchQuery, setSearchQuery] = useState('')
+  const [appliedQuery, setAppliedQuery] = useState('')
+  const [page, setPage] = useState(0)
   const [loading, setLoading] = useState(true)
   const [selectedRecording, setSelectedRecording] = useState(null)
   const [isModalOpen, setIsModalOpen] = useState(false)
   const [videoError, setVideoError] = useState(null)
 
+  // Search runs on the backend, so wait for the user to stop typing and start from the first page
+  useEffect(() => {
+    const timeout = setTimeout(() => {
+      setAppliedQuery(searchQuery.trim())
+      setPage(0)
+    }, 300)
+    return () => clearTimeout(timeout)
+  }, [searchQuery])
+
   useEffect(() => {
     fetchRecordings()
     const interval = setInterval(fetchRecordings, 5000) // Refresh every 5 seconds
     return () => clearInterval(interval)
-  }, [])
+  }, [page, appliedQuery])
 
   const fetchRecordings = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:8000/recordings')
+      const params = new URLSearchParams({ limit: PAGE_SIZE, offset: page * PAGE_SIZE })
+      if (appliedQuery) {
+        params.set('q', appliedQuery)
+      }
+      const response = await fetch(`${BACKEND_URL}/recordings?${params}`)
       const data = await response.json()
       
       if (data.recordings) {
         // Transform backend data to match UI format
         const transformedRecordings = data.recordings.map((rec, index) => ({
-          id: index + 1,
-          title: rec.filename.replace(/\.(avi|mp4)$/i, '').replace(/_/g, ' ').replace(/threat recording/i, 'Threat Detection Event'),
-          camera: index % 3 === 0 ? 'Primary Camera A' : index % 3 === 1 ? 'Backup Camera C' : 'Primary Camera B',
+          id: page * PAGE_SIZE + index + 1,
+          title: rec.title, // Built by the backend, so the search box matches what is shown
+          camera: rec.camera || 'Unknown Camera',
           date: rec.created,
           size: `${rec.size_mb.toFixed(1)} MB`,
-          duration: calculateDuration(rec.size_mb), // Estimate duration from size
-          detections: Math.floor(Math.random() * 15) + 1,
+          duration: rec.duration_seconds != null ? formatDuration(rec.duration_seconds) : calculateDuration(rec.size_mb),
+          detections: rec.detection_count ?? 0,
+          poster: rec.poster ? `${BACKEND_URL}${rec.poster}` : null,
           filename: rec.filename
         }))
         setRecordings(transformedRecordings)
+        setTotalRecordings(data.total ?? transformedRecordings.length)
+        // Retention may have shrunk the archive past the page being viewed
+        if (page > 0 && data.total != null && page * PAGE_SIZE >= data.total) {
+          setPage(Math.max(0, Math.ceil(data.total / PAGE_SIZE) - 1))
+        }
       }
     } catch (error) {
       console.error('Error fetching recordings:', error)
@@ -71,11 +94,20 @@ function Recordings() {
           filename: 'demo3.avi'
         }
       ])
+      setTotalRecordings(3)
     } finally {
       setLoading(false)
     }
   }
 
+  const formatDuration = (seconds) => {
+    const total = Math.round(seconds)
+    const hours = Math.floor(total / 3600)
+    const mins = Math.floor((total % 3600) / 60)
+    const secs = total % 60
+    return `${String(hours).padStart(2, '0')}:${String(mins).padStart(2, '0')}:${String(secs).padStart(2, '0')}`
+  }
+
   const calculateDuration = (sizeMB) => {
     // Rough estimate: ~1MB per minute for compressed video
     const minutes = Math.floor(sizeMB)
@@ -138,10 +170,7 @@ function Recordings() {
     setVideoError(null)
   }
 
-  const filteredRecordings = recordings.filter(rec =>
-    rec.title.toLowerCase().includes(searchQuery.toLowerCase()) ||
-    rec.camera.toLowerCase().includes(searchQuery.toLowerCase())
-  )
+  const pageCount = Math.max(1, Math.ceil(totalRecordings / PAGE_SIZE))
 
   return (
     <div className="space-y-6">
@@ -156,7 +185,7 @@ function Recordings() {
           <svg className="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
             <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M8 7V3m8 4V3m-9 8h10M5 21h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v12a2 2 0 002 2z" />
           </svg>
-          <span className="font-poppins">Total: {recordings.length} recordings</span>
+          <span className="font-poppins">Total: {totalRecordings} recordings</span>
         </div>
       </div>
 
@@ -172,7 +201,7 @@ function Recordings() {
             type="text"
             value={searchQuery}
             onChange={(e) => setSearchQuery(e.target.value)}
-            placeholder="Search recordings by title or camera..."
+            placeholder="Search recordings by title, file name or camera..."
             className="w-full pl-12 pr-4 py-3 bg-slate-secondary/50 border border-neon-primary/20 rounded-lg text-text-light placeholder-text-light/30 focus:outline-none focus:border-neon-primary focus:neon-glow transition-all font-poppins"
           />
         </div>
@@ -183,13 +212,13 @@ function Recordings() {
         <div className="text-center py-12">
           <p className="text-text-light/50 font-poppins">Loading recordings...</p>
         </div>
-      ) : filteredRecordings.length === 0 ? (
+      ) : recordings.length === 0 ? (
         <div className="text-center py-12">
           <p className="text-text-light/50 font-poppins">No recordings found.</p>
         </div>
       ) : (
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-          {filteredRecordings.map((recording) => (
+          {recordings.map((recording) => (
             <div key={recording.id} className="glass-panel rounded-xl p-5 hover:border-neon-primary/50 transition-all group">
               {/* Detection Badge */}
               <div className="flex justify-end mb-3">
@@ -198,11 +227,15 @@ function Recordings() {
                 </span>
               </div>
 
-              {/* Camera Icon Placeholder */}
-              <div className="aspect-video bg-slate-secondary/30 rounded-lg mb-4 flex items-center justify-center">
-                <svg className="w-16 h-16 text-neon-primary/30" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                  <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M15 10l4.553-2.276A1 1 0 0121 8.618v6.764a1 1 0 01-1.447.894L15 14M5 18h8a2 2 0 002-2V8a2 2 0 00-2-2H5a2 2 0 00-2 2v8a2 2 0 002 2z" />
-                </svg>
+              {/* Poster, or camera icon until the preview is generated */}
+              <div className="aspect-video bg-slate-secondary/30 rounded-lg mb-4 flex items-center justify-center overflow-hidden">
+                {recording.poster ? (
+                  <img src={recording.poster} alt={recording.title} loading="lazy" className="w-full h-full object-cover" />
+                ) : (
+                  <svg className="w-16 h-16 text-neon-primary/30" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                    <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M15 10l4.553-2.276A1 1 0 0121 8.618v6.764a1 1 0 01-1.447.894L15 14M5 18h8a2 2 0 002-2V8a2 2 0 00-2-2H5a2 2 0 00-2 2v8a2 2 0 002 2z" />
+                  </svg>
+                )}
               </div>
 
               {/* Recording Details */}
@@ -262,6 +295,29 @@ function Recordings() {
         </div>
       )}
 
+      {/* Pagination */}
+      {!loading && totalRecordings > PAGE_SIZE && (
+        <div className="flex items-center justify-center gap-4">
+          <button
+            onClick={() => setPage(page - 1)}
+            disabled={page === 0}
+            className="px-4 py-2 bg-slate-secondary/50 hover:bg-neon-primary/20 border border-neon-primary/30 hover:border-neon-primary rounded-lg text-text-light hover:text-neon-primary transition-all disabled:opacity-40 disabled:pointer-events-none font-poppins text-sm"
+          >
+            Previous
+          </button>
+          <span className="text-sm text-text-light/70 font-poppins">
+            Page {page + 1} of {pageCount}
+          </span>
+          <button
+            onClick={() => setPage(page + 1)}
+            disabled={page + 1 >= pageCount}
+            className="px-4 py-2 bg-slate-secondary/50 hover:bg-neon-primary/20 border border-neon-primary/30 hover:border-neon-primary rounded-lg text-text-light hover:text-neon-primary transition-all disabled:opacity-40 disabled:pointer-events-none font-poppins text-sm"
+          >
+            Next
+          </button>
+        </div>
+      )}
+
       {/* Video Modal */}
       {isModalOpen && selectedRecording && (
         <div 